@@ -3,7 +3,6 @@ from flask import Flask
 from flask_cors import CORS
 from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
-from huggingface_hub import login
 
 
 load_dotenv()
@@ -31,9 +30,16 @@ CORS(
 
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+from .config.db_connection import close_db, commit_db
+app.after_request(commit_db)
+app.teardown_appcontext(close_db)
+
 from .middleware.auth import auth
 app.register_blueprint(auth)
 
 from .routes import api_routes
 
+from .models.warmup import start_warmup
+start_warmup()
+
 # login(token=os.getenv("HUGGINGFACE_HUB_TOKEN"))
\ No newline at end of file
@@ -4,7 +4,7 @@ import os
 from app.config import db_connection
 
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
+from app.models.embeddings import get_embedding_service
 from pgvector.psycopg2 import register_vector
 
 
@@ -19,7 +19,7 @@ class populateDB:
 
         self.reviews = "../data_json/reviews/"
         self.votes = "../data_json/votes/"
-        self.gemma_model = SentenceTransformer("google/embeddinggemma-300m")
+        self.gemma_model = get_embedding_service()
 
 
     def populateCoursesTable(self, cursor):
@@ -148,17 +148,18 @@ class populateDB:
 
             cursor.execute("SELECT course_number, course_description from courses")
             documents = cursor.fetchall()
-            for record in tqdm(documents, desc="Populating course embeddings"):
+            embeddings = self.gemma_model.encode_documents([record[1] for record in documents])
+            for record, embedding in tqdm(zip(documents, embeddings), total=len(documents),
+                                          desc="Populating course embeddings"):
                 course_number = record[0]
-                embeddings = self.gemma_model.encode_document(record[1])
 
 
                 cursor.execute("INSERT INTO course_embeddings (course_id, embedding) VALUES (%s, %s)",
-                               (course_number, embeddings)
+                               (course_number, embedding)
                                )
 
         except Exception as e:
-            print("Failed to populate course embeddings table: "+e)
+            print("Failed to populate course embeddings table: "+str(e))
 
     def populateReviewEmbeddingsTable(self, cursor):
 
@@ -168,11 +169,13 @@ class populateDB:
 
             cursor.execute("SELECT review_id, comment from review")
             documents = cursor.fetchall()
-            for record in tqdm(documents, desc="Populating review embeddings"):
+            embeddings = self.gemma_model.encode_documents([record[1] for record in documents])
+            for record, embedding in tqdm(zip(documents, embeddings), total=len(documents),
+                                          desc="Populating review embeddings"):
                 review_id = record[0]
 
                 cursor.execute("INSERT INTO review_embeddings (review_id, embedding) VALUES (%s, %s)",
-                               (review_id, self.gemma_model.encode_document(record[1])
+                               (review_id, embedding
                                ))
 
         except Exception as e:
@@ -193,11 +196,12 @@ class populateDB:
                 for record in votes_data[batch_key]:
 
 
+                    # vote_id comes from the sequence, explicit ids would leave it behind the table
                     cursor.execute(
-                        '''INSERT INTO public.votes(vote_id, review_id, username, vote_type)
-                           VALUES (%s, %s, %s, %s)''',
+                        '''INSERT INTO public.votes(review_id, username, vote_type)
+                           VALUES (%s, %s, %s)''',
 
-                        (record["vote_id"],record["review_id"],record["username"],record["vote_type"])
+                        (record["review_id"],record["username"],record["vote_type"])
                     )
 
             print("Successfully populated votes table")
@@ -294,7 +298,8 @@ class populateDB:
 
 
 if __name__ == "__main__":
-    cursor, connection = db_connection.connect()
+    connection = db_connection.connect()
+    cursor = connection.cursor()
 
     # change the name of the table you want to populate
     populateDB().populateVotesTable(cursor)
@@ -302,7 +307,7 @@ if __name__ == "__main__":
 
     cursor.close()
     connection.close()
-    print("connection closed!")
+    print("connection returned to the pool!")
 
 
 
@@ -1,6 +1,15 @@
 import psycopg2
+import psycopg2.extensions
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from flask import g, has_request_context, jsonify
+from pgvector.psycopg2 import register_vector
+
+from ..utils.metrics import Histogram, register
 
 load_dotenv()
 
@@ -10,31 +19,457 @@ db_user = os.getenv("DB_USER")
 db_pass = os.getenv("DB_PASSWORD")
 db_port = os.getenv("DB_PORT")
 
+# pool sizing, all timeouts are in seconds
+pool_min_size = int(os.getenv("DB_POOL_MIN", "1"))
+pool_max_size = int(os.getenv("DB_POOL_MAX", "10"))
+pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+pool_idle_timeout = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))
+pool_health_check_after = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))
+
+
+class PoolTimeout(Exception):
+    """
+        Raised when no connection could be borrowed from the pool within the wait timeout.
+    """
+
+
+class ConnectionPool:
+    """
+        Thread-safe pool of psycopg2 connections shared by the whole process.
+
+        min_size connections are opened up front and kept open, more are opened on demand
+        up to max_size and handed back with putconn(). A connection that sat idle longer
+        than health_check_after seconds is probed with "SELECT 1" when it is checked out,
+        and idle connections above min_size are closed by a reaper thread once they pass
+        idle_timeout. The reaper also reopens connections when the pool fell below min_size.
+    """
+
+    def __init__(self, min_size, max_size, timeout, idle_timeout, health_check_after, **connect_kwargs):
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.connect_kwargs = connect_kwargs
+
+        self._idle = deque()
+        self._in_use = set()
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._counters = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "connections_reaped": 0,
+            "health_check_failures": 0,
+        }
+        self.wait_ms = Histogram()
+
+        self.fill()
+        self._reaper = threading.Thread(target=self._reap_loop, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _open(self):
+        connection = psycopg2.connect(**self.connect_kwargs)
+        try:
+            # numpy embeddings are then sent as pgvector literals instead of float lists
+            register_vector(connection)
+        except psycopg2.ProgrammingError as e:
+            print(f"pgvector types not registered: {e}")
+        connection.rollback()
+        with self._cond:
+            self._counters["connections_opened"] += 1
+        return connection
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._counters["connections_closed"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, connection, idle_since):
+        if connection.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=None):
+        """
+        Borrows a connection, opening a new one if the pool has not reached max_size.
+        Blocks for up to timeout seconds when the pool is exhausted and raises PoolTimeout.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            connection = None
+            idle_since = None
+            must_open = False
+
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._counters["timeouts"] += 1
+                            raise PoolTimeout(f"no database connection available after {timeout}s "
+                                              f"({self._size}/{self.max_size} in use)")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                else:
+                    self._size += 1
+                    must_open = True
+
+            if must_open:
+                try:
+                    connection = self._open()
+                except psycopg2.Error:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(connection, idle_since):
+                with self._cond:
+                    self._counters["health_check_failures"] += 1
+                self._discard(connection)
+                continue
+
+            with self._cond:
+                self._in_use.add(id(connection))
+                self._counters["checkouts"] += 1
+            self.wait_ms.observe((time.monotonic() - started) * 1000)
+            return connection
+
+    def putconn(self, connection, close=False):
+        """
+        Returns a borrowed connection. Any open transaction is rolled back and broken
+        connections are dropped instead of going back to the idle list.
+        """
+        with self._cond:
+            if id(connection) not in self._in_use:
+                return
+            self._in_use.discard(id(connection))
+
+        if not close and not connection.closed:
+            try:
+                if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                close = True
+
+        if close or connection.closed or self._closed:
+            self._discard(connection)
+            return
+
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def fill(self):
+        """
+        Opens idle connections until the pool holds min_size. A database that cannot be
+        reached is reported and left to the next attempt, the pool still opens on demand.
+        """
+        while True:
+            with self._cond:
+                if self._closed or self._size >= min(self.min_size, self.max_size):
+                    return
+                self._size += 1
+
+            try:
+                connection = self._open()
+            except psycopg2.Error as e:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                print(f"Could not open a pooled connection: {e}")
+                return
+
+            with self._cond:
+                self._idle.appendleft((connection, time.monotonic()))
+                self._cond.notify()
+
+    def reap_idle(self):
+        """
+        Closes connections that have been idle longer than idle_timeout, keeping min_size open.
+        """
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            keep = deque()
+            # oldest connections sit at the left end of the deque
+            while self._idle:
+                connection, idle_since = self._idle.popleft()
+                if (now - idle_since > self.idle_timeout
+                        and self._size - len(expired) > self.min_size):
+                    expired.append(connection)
+                else:
+                    keep.append((connection, idle_since))
+            self._idle = keep
+            self._counters["connections_reaped"] += len(expired)
+
+        for connection in expired:
+            self._discard(connection)
+
+    def _reap_loop(self):
+        interval = max(min(self.idle_timeout / 2, 60), 1)
+        while not self._closed:
+            time.sleep(interval)
+            self.reap_idle()
+            self.fill()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+            }
+            stats.update(self._counters)
+        stats["wait_ms"] = self.wait_ms.snapshot()
+        return stats
+
+
+class PooledConnection:
+    """
+        Thin proxy around a borrowed psycopg2 connection.
+        close() hands the connection back to the pool instead of closing the socket.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self._connection.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._connection.__exit__(exc_type, exc_value, traceback)
+
+    @property
+    def raw(self):
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._pool.putconn(self._connection)
+            self._connection = None
+
+    def __del__(self):
+        # safety net for code paths that return before calling close()
+        self.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    pool_min_size,
+                    pool_max_size,
+                    pool_timeout,
+                    pool_idle_timeout,
+                    pool_health_check_after,
+                    host=db_host,
+                    database=db_name,
+                    user=db_user,
+                    password=db_pass,
+                    port=db_port,
+                )
+    return _pool
+
+
+def pool_stats():
+    if _pool is None:
+        return {"size": 0, "min_size": pool_min_size, "max_size": pool_max_size}
+    return _pool.stats()
+
+
+register("db_pool", pool_stats)
+
 
 def connect():
+    """
+    Borrows a connection from the process-wide pool. Calling close() on the returned
+    connection gives it back to the pool. Raises the psycopg2 error when the database
+    cannot be reached.
+    """
     try:
-        connection = psycopg2.connect(
-            host=db_host,
-            database=db_name,
-            user=db_user,
-            password=db_pass,
-            port=db_port,
-        )
-        cursor = connection.cursor()
-
-        #execute assistant_queries with cursor
-        cursor.execute('SELECT version();')
-        db_version = cursor.fetchone()
-        print(db_version)
-        print("connected successfully")
+        connection = PooledConnection(get_pool(), get_pool().getconn())
     except psycopg2.Error as e:
         print(f"Error connecting to PostgreSQL:{e}")
-        return
+        raise
     return connection
 
 
 
+def get_db():
+    """
+    Returns the connection bound to the current request, borrowing it from the pool on first use.
+    Everything executed on it during the request runs in one transaction that is committed by
+    commit_db() before the response is sent, or rolled back by close_db() when the request failed.
+    """
+    if "db" not in g:
+        g.db = connect()
+    return g.db
+
+
+def _commit(connection):
+    if connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+        # committing an aborted transaction silently rolls it back
+        raise psycopg2.InternalError("a statement of the request failed")
+    connection.commit()
+
+
+def commit_db(response):
+    """
+    after_request hook: commits the request's unit of work before the response is sent. A
+    transaction left aborted by a failed statement, or a commit that fails, turns the response
+    into a 500 instead of reporting success for data that was not saved. Error responses
+    (5xx) are rolled back.
+    """
+    connection = g.get("db")
+    if connection is None:
+        return response
+
+    try:
+        if response.status_code >= 500:
+            connection.rollback()
+            return response
+        _commit(connection)
+    except psycopg2.Error as e:
+        print(f"Error committing request transaction: {e}")
+        connection.rollback()
+        response = jsonify({"success": False, "message": "Your changes could not be saved, please try again"})
+        response.status_code = 500
+    return response
+
+
+def release_db():
+    """
+    Commits the request's unit of work and returns its connection to the pool right away, for
+    responses that keep running long after the view returned, e.g. streamed replies. Raises the
+    psycopg2 error when the commit fails.
+    """
+    connection = g.pop("db", None)
+    if connection is None:
+        return
+
+    try:
+        _commit(connection)
+    except psycopg2.Error:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def close_db(exception=None):
+    """
+    Teardown hook: returns the request's connection to the pool. Whatever commit_db() did not
+    commit, e.g. after an unhandled exception, is rolled back.
+    """
+    connection = g.pop("db", None)
+    if connection is None:
+        return
+
+    try:
+        connection.rollback()
+    except psycopg2.Error as e:
+        print(f"Error finishing request transaction: {e}")
+    finally:
+        connection.close()
+
+
+def in_request_scope():
+    # only requests share a connection, CLI and worker code under app.app_context() borrow their own
+    return has_request_context()
+
+
+@contextmanager
+def borrow():
+    """
+    Yields the request-scoped connection when called inside a request, otherwise a
+    connection borrowed from the pool that is returned when the block exits.
+    """
+    if in_request_scope():
+        yield get_db()
+        return
+
+    connection = connect()
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+@contextmanager
+def savepoint(connection, name="statement"):
+    """
+    Runs the block under a savepoint. A psycopg2 error rolls the connection back to it and is
+    re-raised, so only the failed statements are undone: the earlier work of the request stays
+    in its transaction and the transaction is not left aborted for the statements after it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SAVEPOINT {name}")
+    try:
+        yield
+    except psycopg2.Error:
+        with connection.cursor() as cursor:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {name}")
+        raise
+    with connection.cursor() as cursor:
+        cursor.execute(f"RELEASE SAVEPOINT {name}")
+
+
 def close(connection):
 
         connection.close()
-        print("PostgreSQL connection closed.")
\ No newline at end of file
+        print("PostgreSQL connection returned to the pool.")
@@ -0,0 +1,115 @@
+import select
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+import psycopg2.extensions
+
+from . import db_connection
+
+
+class NotificationListener:
+    """
+        Keeps one dedicated connection LISTENing on PostgreSQL channels and dispatches every
+        NOTIFY to the callbacks subscribed in this process.
+
+        Callbacks receive the notification payload. After every (re)connect they are also
+        called with None, since notifications sent while disconnected are lost and caches
+        have to resynchronize from the database.
+    """
+
+    def __init__(self, reconnect_delay=5.0):
+        self.reconnect_delay = reconnect_delay
+        self._callbacks = defaultdict(list)
+        self._listening = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.received = 0
+        self.reconnects = 0
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._callbacks[channel].append(callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-notification-listener", daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        connection = psycopg2.connect(
+            host=db_connection.db_host,
+            database=db_connection.db_name,
+            user=db_connection.db_user,
+            password=db_connection.db_pass,
+            port=db_connection.db_port,
+        )
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return connection
+
+    def _listen_new_channels(self, connection):
+        with self._lock:
+            channels = [channel for channel in self._callbacks if channel not in self._listening]
+
+        if not channels:
+            return []
+
+        cursor = connection.cursor()
+        for channel in channels:
+            cursor.execute(f'LISTEN "{channel}"')
+        cursor.close()
+        self._listening.update(channels)
+        return channels
+
+    def _dispatch(self, channel, payload):
+        with self._lock:
+            callbacks = list(self._callbacks.get(channel, ()))
+
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"[notifications] callback for {channel} failed: {e}")
+
+    def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = self._connect()
+                self._listening = set()
+
+                while True:
+                    # channels subscribed since the last tick start listening now and resync once
+                    for channel in self._listen_new_channels(connection):
+                        self._dispatch(channel, None)
+
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        self.received += 1
+                        self._dispatch(notification.channel, notification.payload)
+
+            except psycopg2.Error as e:
+                print(f"[notifications] listener connection lost: {e}")
+                self.reconnects += 1
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except psycopg2.Error:
+                        pass
+
+            time.sleep(self.reconnect_delay)
+
+
+_listener = NotificationListener()
+
+
+def subscribe(channel, callback):
+    """
+    Calls callback(payload) for every NOTIFY on channel, and callback(None) whenever
+    notifications may have been missed.
+    """
+    _listener.subscribe(channel, callback)
@@ -0,0 +1,103 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Matryoshka dimension kept from each embedding, embeddinggemma supports 768, 512, 256 and 128
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "768"))
+# "vector" stores float32 values, "halfvec" float16 (pgvector 0.7 or newer)
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "vector").lower()
+
+STORAGE_TYPES = ("vector", "halfvec")
+OPERATOR_CLASSES = {"vector": "vector_cosine_ops", "halfvec": "halfvec_cosine_ops"}
+# placeholder for the storage type in the casts of the similarity search queries
+EMBEDDING_TYPE_PLACEHOLDER = "{embedding_type}"
+
+
+def column_type(storage=EMBEDDING_STORAGE, dim=EMBEDDING_DIM):
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"unknown embedding storage {storage}, expected one of {', '.join(STORAGE_TYPES)}")
+    return f"{storage}({dim})"
+
+
+def operator_class(storage=EMBEDDING_STORAGE):
+    return OPERATOR_CLASSES[storage]
+
+
+def with_embedding_type(queries: dict, storage=EMBEDDING_STORAGE) -> dict:
+    """
+    Fills the storage type into the "%s::{embedding_type}" casts of a loaded query file, so the
+    query embedding has the same type as the embedding columns.
+    """
+    return {name: query.replace(EMBEDDING_TYPE_PLACEHOLDER, storage) if isinstance(query, str) else query
+            for name, query in queries.items()}
+
+
+def _parse_column_type(text):
+    # "vector(768)" -> ("vector", 768), an unconstrained "vector" has no dimension
+    storage, _, dim = text.partition("(")
+    return storage, int(dim.rstrip(")")) if dim else None
+
+
+def ensure_embedding_storage(storage=EMBEDDING_STORAGE, dim=EMBEDDING_DIM):
+    """
+    Converts the embedding columns to the configured storage profile. Stored embeddings are
+    truncated to the first dim values and renormalized in place, the same as
+    EmbeddingService does for new ones, so nothing has to be re-encoded. Growing the
+    dimension is refused, the cut values are gone and the embeddings have to be recomputed
+    with PopulateDB into columns of the new type.
+
+    The ANN index of a converted table is dropped first since its operator class depends on
+    the column type, ensure_vector_indexes() builds it again.
+    """
+    from .vector_indexes import VECTOR_TABLES, _connect, queries
+
+    wanted = column_type(storage, dim)
+    connection = _connect()
+    cursor = connection.cursor()
+
+    try:
+        for table, index in VECTOR_TABLES.items():
+            cursor.execute(queries["embedding_column_type_query"], (table,))
+            row = cursor.fetchone()
+            if row is None:
+                print(f"Skipped {table}: no embedding column")
+                continue
+
+            current = row[0]
+            if current == wanted:
+                print(f"{table}.embedding is up to date ({wanted})")
+                continue
+
+            _, current_dim = _parse_column_type(current)
+            if current_dim is not None and dim > current_dim:
+                raise RuntimeError(f"{table}.embedding is {current}, embeddings cannot be widened to {wanted}; "
+                                   f"recompute them with PopulateDB instead")
+
+            cursor.execute(queries["pgvector_version_query"])
+            version = tuple(int(part) for part in cursor.fetchone()[0].split(".")[:2])
+            if version < (0, 7):
+                raise RuntimeError(f"converting {table}.embedding to {wanted} needs pgvector 0.7 or newer")
+
+            cursor.execute(queries["drop_index"].format(index=index))
+            if dim == current_dim:
+                using = f"embedding::{wanted}"
+            else:
+                using = f"l2_normalize(subvector(embedding::vector, 1, {dim}))::{wanted}"
+            cursor.execute(queries["alter_embedding_type"].format(table=table, type=wanted, using=using))
+            print(f"Converted {table}.embedding from {current} to {wanted}")
+    finally:
+        cursor.close()
+        connection.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert the embedding columns to a storage profile")
+    parser.add_argument("--storage", choices=STORAGE_TYPES, default=EMBEDDING_STORAGE)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    args = parser.parse_args()
+
+    ensure_embedding_storage(args.storage, args.dim)
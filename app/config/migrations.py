@@ -0,0 +1,63 @@
+import json
+import os
+
+import psycopg2
+
+from . import db_connection
+from .embedding_storage import ensure_embedding_storage
+from .vector_indexes import ensure_vector_indexes
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(BASE_DIR, "utils", "migration_queries.json"), "r") as file:
+    queries = json.load(file)
+
+
+def pending_migrations(cursor):
+    cursor.execute(queries["create_migrations_table"])
+    cursor.execute(queries["applied_migrations_query"])
+    applied = {row[0] for row in cursor.fetchall()}
+
+    return [(name, statements) for name, statements in queries["migrations"].items() if name not in applied]
+
+
+def run_migrations():
+    """
+    Applies every migration from migration_queries.json that is not recorded in schema_migrations yet,
+    in file order. Each migration runs in its own transaction. Afterwards the embedding columns are
+    brought in line with EMBEDDING_STORAGE and EMBEDDING_DIM, and the vector indexes with
+    VECTOR_INDEX_TYPE and its build parameters.
+    """
+    connection = db_connection.connect()
+    cursor = connection.cursor()
+
+    try:
+        pending = pending_migrations(cursor)
+        connection.commit()
+
+        if not pending:
+            print("Schema is up to date")
+
+        for name, statements in pending:
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute(queries["record_migration_query"], (name,))
+                connection.commit()
+                print(f"Applied migration {name}")
+            except psycopg2.Error as e:
+                connection.rollback()
+                print(f"Failed to apply migration {name}: {e}")
+                raise
+    finally:
+        cursor.close()
+        connection.close()
+
+    # the embedding columns and ANN indexes depend on configuration, not only on the schema, so they
+    # are reconciled on every run, the columns first since converting one drops its index
+    ensure_embedding_storage()
+    ensure_vector_indexes()
+
+
+if __name__ == "__main__":
+    run_migrations()
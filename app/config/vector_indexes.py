@@ -0,0 +1,147 @@
+import json
+import math
+import os
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+from . import db_connection
+from .embedding_storage import EMBEDDING_STORAGE, operator_class
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(BASE_DIR, "utils", "vector_index_queries.json"), "r") as file:
+    queries = json.load(file)
+
+# "hnsw", "ivfflat" or "none" (exact scans)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()
+# build parameters
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+# 0 picks the pgvector recommendation from the row count at build time
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))
+# per-query search parameters, higher means better recall and slower queries
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+
+# tables searched with "ORDER BY embedding <=> query" and the managed index on each
+VECTOR_TABLES = {
+    "review_embeddings": "review_embeddings_embedding_idx",
+    "course_embeddings": "course_embeddings_embedding_idx",
+}
+
+
+def ivfflat_lists(rows):
+    # rows / 1000 up to a million rows, sqrt(rows) above, as recommended by pgvector
+    if rows <= 1_000_000:
+        return max(rows // 1000, 1)
+    return int(math.sqrt(rows))
+
+
+def index_config(index_type=VECTOR_INDEX_TYPE):
+    """
+    Description of the wanted index, stored as the index comment so a changed configuration
+    is detected and the index rebuilt.
+    """
+    if index_type == "hnsw":
+        return f"hnsw m={HNSW_M} ef_construction={HNSW_EF_CONSTRUCTION}"
+    if index_type == "ivfflat":
+        return f"ivfflat lists={IVFFLAT_LISTS or 'auto'}"
+    if index_type == "none":
+        return None
+    raise ValueError(f"unknown vector index type {index_type}")
+
+
+def create_index_sql(table, index, index_type, rows=0, storage=EMBEDDING_STORAGE, **params):
+    opclass = operator_class(storage)
+    if index_type == "hnsw":
+        return queries["create_hnsw_index"].format(index=index, table=table, opclass=opclass,
+                                                   m=int(params.get("m", HNSW_M)),
+                                                   ef_construction=int(params.get("ef_construction",
+                                                                                  HNSW_EF_CONSTRUCTION)))
+    if index_type == "ivfflat":
+        lists = int(params.get("lists", IVFFLAT_LISTS) or ivfflat_lists(rows))
+        return queries["create_ivfflat_index"].format(index=index, table=table, opclass=opclass, lists=lists)
+    raise ValueError(f"unknown vector index type {index_type}")
+
+
+def search_settings(index_type=VECTOR_INDEX_TYPE, ef_search=HNSW_EF_SEARCH, probes=IVFFLAT_PROBES):
+    """
+    Returns (sql, params) to put in front of a nearest-neighbour query in the same execute().
+    SET LOCAL only lasts until the end of the current transaction.
+    """
+    if index_type == "hnsw":
+        return queries["hnsw_search_settings"], (ef_search,)
+    if index_type == "ivfflat":
+        return queries["ivfflat_search_settings"], (probes,)
+    return "", ()
+
+
+def _connect():
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    connection = psycopg2.connect(
+        host=db_connection.db_host,
+        database=db_connection.db_name,
+        user=db_connection.db_user,
+        password=db_connection.db_pass,
+        port=db_connection.db_port,
+    )
+    connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    return connection
+
+
+def ensure_vector_indexes(index_type=VECTOR_INDEX_TYPE, rebuild=False):
+    """
+    Creates the configured ANN index on every embedding table, concurrently so reviews can
+    still be written meanwhile. An index built with a different configuration, or left
+    invalid by an interrupted build, is dropped and rebuilt. With index_type "none" the
+    managed indexes are dropped.
+    """
+    wanted = index_config(index_type)
+    connection = _connect()
+    cursor = connection.cursor()
+
+    try:
+        for table, index in VECTOR_TABLES.items():
+            cursor.execute(queries["index_state_query"], (index,))
+            row = cursor.fetchone()
+            up_to_date = row is not None and row[0] and row[1] == wanted
+
+            if up_to_date and not rebuild:
+                print(f"{index} is up to date ({wanted})")
+                continue
+
+            if row is not None:
+                cursor.execute(queries["drop_index"].format(index=index))
+                print(f"Dropped {index} ({row[1] or 'unmanaged'}{'' if row[0] else ', invalid'})")
+
+            if wanted is None:
+                continue
+
+            cursor.execute(queries["row_count_query"].format(table=table))
+            rows = cursor.fetchone()[0]
+            if index_type == "ivfflat" and rows == 0:
+                # ivfflat picks its centroids from the existing rows
+                print(f"Skipped {index}: {table} is empty, build the ivfflat index after loading embeddings")
+                continue
+
+            cursor.execute(create_index_sql(table, index, index_type, rows))
+            cursor.execute(queries["comment_index"].format(index=index), (wanted,))
+            print(f"Created {index} on {rows} rows ({wanted})")
+    finally:
+        cursor.close()
+        connection.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create or rebuild the pgvector ANN indexes")
+    parser.add_argument("--type", choices=["hnsw", "ivfflat", "none"], default=VECTOR_INDEX_TYPE)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild even if the configuration did not change")
+    args = parser.parse_args()
+
+    ensure_vector_indexes(args.type, args.rebuild)
@@ -1,22 +1,105 @@
 import os
-from flask import request, jsonify, render_template
-from ..models.assistant import AssistantRoles
-import asyncio
+import json
+import uuid
+from flask import request, jsonify, render_template, Response, session
+from ..config.db_connection import release_db
+from ..models.assistant import get_assistant_roles
+from ..models.answer_cache import get_answer_cache
+from ..models.inference import InferenceQueueFull, InferenceTimeout
 from ..utils.helper import IntentClassifier
 
 
-assistant_roles = AssistantRoles()
-
 def get_assistant():
 
+    # every visit to the assistant page starts a new conversation
+    previous = session.get('chat_id')
+    if previous:
+        get_assistant_roles().memory.forget(previous)
+    session['chat_id'] = uuid.uuid4().hex
+
     return render_template("assistant.html")
 
 
+def get_chat_id():
+    if 'chat_id' not in session:
+        session['chat_id'] = uuid.uuid4().hex
+    return session['chat_id']
+
+
+def wants_stream(data):
+    """
+    Streaming is requested with "stream": true in the body or an Accept: text/event-stream header.
+    """
+    if data.get('stream'):
+        return True
+    return request.accept_mimetypes.best == 'text/event-stream'
+
+
+def sse_event(data, event=None):
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def stream_answer(messages, intent, chat_id, user_message, on_complete=None):
+    """
+    Sends the reply as Server-Sent Events: one "data" event per decoded chunk of tokens, then
+    a "done" event carrying the intent, or an "error" event if generation fails midway.
+    on_complete is called with the full reply once it has been sent.
+
+    The request's unit of work is committed and its connection returned to the pool before
+    the first event, so a reply streaming for minutes does not hold a connection. The events
+    are generated outside the request context: on_complete must take its own connection with
+    borrow() if it needs the database.
+    """
+    # queued before the response starts so a full queue still gets a 503
+    tokens = get_assistant_roles().chat_stream(messages, chat_id, user_message)
+    release_db()
+
+    def generate():
+        try:
+            reply = []
+            for chunk in tokens:
+                reply.append(chunk)
+                yield sse_event({'token': chunk})
+            if on_complete:
+                on_complete("".join(reply).rstrip())
+            yield sse_event({'intent': intent}, event='done')
+        except InferenceTimeout as e:
+            print(f"[TIMEOUT in stream_answer]: {str(e)}")
+            yield sse_event({
+                'error': 'The assistant took too long to answer, please try again'
+            }, event='error')
+        except Exception as e:
+            print(f"[ERROR in stream_answer]: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield sse_event({
+                'error': 'An error occurred processing your request',
+                'details': str(e)
+            }, event='error')
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+def stream_cached_answer(answer, intent):
+    def generate():
+        yield sse_event({'token': answer})
+        yield sse_event({'intent': intent, 'cached': True}, event='done')
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
 def answer_question(conn):
 
-    try:
+    cursor = conn.cursor()
 
-        cursor = conn.cursor()
+    try:
 
         data = request.get_json()
 
@@ -51,17 +134,53 @@ def answer_question(conn):
             print(f"[CLASSIFIED INTENT]: {intent}")
 
 
+        assistant_roles = get_assistant_roles()
+        answer_cache = get_answer_cache()
+        chat_id = get_chat_id()
+        stream = wants_stream(data)
+
+        # only a conversation's first question can share an answer with other conversations
+        cacheable = answer_cache.enabled and not assistant_roles.is_follow_up(chat_id)
+        if cacheable:
+            cached = assistant_roles.cached_reply(intent, user_message, chat_id)
+            if cached is not None:
+                print("[ANSWER CACHE]: hit")
+                if stream:
+                    return stream_cached_answer(cached, intent)
+                return jsonify({
+                    'response': cached,
+                    'intent': intent,
+                    'cached': True
+                }), 200
+
+        # taken before retrieval, an answer built from data changed meanwhile is not cached
+        generation = answer_cache.generation()
+
+        # retrieval and prompt building finish here, before the cursor is closed; only generation streams
         if intent == 'compare':
             print("[ROUTING TO]: compare_two_professors")
-            response = asyncio.run(assistant_roles.compare_two_professors(cursor,user_message))
+            messages, instructors = assistant_roles.build_comparison_messages(cursor, user_message)
 
         elif intent == 'curriculum':
             print("[ROUTING TO]: recommend_curriculum")
-            response = asyncio.run(assistant_roles.recommend_curriculum(cursor,user_message))
+            messages, instructors = assistant_roles.build_curriculum_messages(cursor, user_message)
 
         else:
             print("[ROUTING TO]: QnA")
-            response = asyncio.run(assistant_roles.QnA(cursor,user_message))
+            messages, instructors = assistant_roles.build_qna_messages(cursor, user_message)
+
+        def remember(answer):
+            if cacheable:
+                assistant_roles.cache_reply(intent, user_message, answer, instructors, generation)
+
+        cursor.close()
+        if stream:
+            return stream_answer(messages, intent, chat_id, user_message, on_complete=remember)
+
+        # generation can take up to INFERENCE_TIMEOUT, the connection goes back to the pool first
+        release_db()
+        response = assistant_roles.reply(messages, chat_id, user_message)
+        remember(response)
 
 
         return jsonify({
@@ -69,6 +188,18 @@ def answer_question(conn):
             'intent': intent
         }), 200
 
+    except InferenceQueueFull as e:
+        print(f"[BUSY in answer_question]: {str(e)}")
+        return jsonify({
+            'error': 'The assistant is busy right now, please try again in a moment'
+        }), 503, {'Retry-After': '5'}
+
+    except InferenceTimeout as e:
+        print(f"[TIMEOUT in answer_question]: {str(e)}")
+        return jsonify({
+            'error': 'The assistant took too long to answer, please try again'
+        }), 504
+
     except Exception as e:
         print(f"[ERROR in answer_question]: {str(e)}")
         import traceback
@@ -79,7 +210,7 @@ def answer_question(conn):
         }), 500
 
     finally:
-        conn.close()
+        cursor.close()
 
 
 
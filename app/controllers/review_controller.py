@@ -4,7 +4,8 @@ from flask import request, jsonify, render_template, session, flash, redirect, u
 from ..models.intructors import Instructor
 from ..models import reviews as r
 from ..models.reviews import Reviews
-from ..utils.helper import validate_instructor, get_consensus_summary, update_summary_cache
+from ..models.review_jobs import enqueue_review_jobs
+from ..utils.helper import get_consensus_summary
 
 
 def get_user_reviews(conn):
@@ -36,7 +37,6 @@ def get_user_reviews(conn):
         finally:
 
             cursor.close()
-            conn.close()
 
         return render_template("reviews/pastreviews.html", reviews=result,
                                message = message, message_type="info")
@@ -47,55 +47,34 @@ def get_reviews_for_instructor(conn, instructor_name):
 
     message = ""
 
-    validate_instructor_results = validate_instructor(cursor, instructor_name )
+    instructor_first = instructor_name.split(" ")[0]
+    instructor_last = instructor_name.split(" ")[-1]
 
-    if (validate_instructor_results):
-        instructor_first, instructor_last = validate_instructor_results
+    try:
+        # identity, departments, courses, average rating and reviews in a single statement
+        profile = Instructor.get_instructor_profile(cursor, instructor_name, session.get("user_id"))
 
-    else:
-        message += "Instructor does not exist"
-        cursor.close()
+        if profile is None:
+            message += "Instructor does not exist"
 
-        return render_template("reviews/professor_reviews.html", reviews=[], message=message)
+            return render_template("reviews/professor_reviews.html", reviews=[], message=message)
+
+        instructor_first, instructor_last = profile['first_name'], profile['last_name']
 
-    try:
         print("getting summary...")
         consensus_summary = get_consensus_summary(instructor_first, instructor_last)
         print("got summary")
         print(consensus_summary)
 
-        print("getting departments")
-        departments = Instructor.get_departments_of_instructor(cursor, instructor_name)
-        print("got departments")
-
-        print("getting courses")
-        courses = Instructor.get_courses_of_instructor(cursor, instructor_name)
-        print("got courses")
-
-        print("getting avg rating")
-        avg_rating = Instructor.get_average_rating(cursor, instructor_name)
-        print("got avg rating")
-
-        if not departments:
-            departments = []
-        if not courses:
-            courses = []
-        if not avg_rating:
-            avg_rating = 'NA'
-
-        username = session.get("user_id")
-
         instructor_info = {
             'first_name': instructor_first,
             'last_name': instructor_last,
-            'courses': courses,
-            'departments': departments,
-            'avg_rating': avg_rating,
+            'courses': profile['courses'],
+            'departments': profile['departments'],
+            'avg_rating': profile['avg_rating'] or 'NA',
             'consensus_summary': consensus_summary
         }
-        print("getting reviews")
-        result = Reviews.get_reviews_for_instructor(cursor, instructor_first, instructor_last, username)
-        print("got reviews")
+        result = profile['reviews']
 
         if not result:
             message += "No reviews found for this instructor"
@@ -114,7 +93,6 @@ def get_reviews_for_instructor(conn, instructor_name):
 
     finally:
         cursor.close()
-        conn.close()
 
     return render_template("reviews/professor_reviews.html",
                            reviews=result,
@@ -180,7 +158,6 @@ def edit_review(review_id, conn):
         })
     finally:
         cursor.close()
-        conn.close()
 
 def delete_review(review_id, conn):
 
@@ -233,7 +210,6 @@ def delete_review(review_id, conn):
 
     finally:
         cursor.close()
-        conn.close()
 
 def review_form(instructor_first,instructor_last):
     """Display review form for a specific professor"""
@@ -262,8 +238,10 @@ def review_form(instructor_first,instructor_last):
                         username = user_id)
 
         review = r.save_review(new_review)
-        update_summary_cache(instructor_first, instructor_last)
-        r.save_review_embedding(review.id,review.embedding)
+
+        # embedding and summary refresh run in the review workers, the jobs commit with the review
+        if review.id:
+            enqueue_review_jobs(review.id, instructor_first, instructor_last)
 
         print(review)
         
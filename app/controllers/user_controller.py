@@ -1,5 +1,5 @@
 import psycopg2
-from ..config.db_connection import connect
+from ..config.db_connection import get_db
 from flask import (Blueprint, flash, redirect, render_template, request, session, url_for)
 from ..models.user import Users
 from werkzeug.security import check_password_hash, generate_password_hash
@@ -10,7 +10,7 @@ def register():
         username = request.form['username']
         password = request.form['password']
         school_year = request.form.get('school_year') or None
-        db = connect()
+        db = get_db()
         cursor = db.cursor()
         error = None
 
@@ -38,7 +38,6 @@ def register():
 
         flash(error)
         cursor.close()
-        db.close()
 
     return render_template('auth/register.html')
 
@@ -48,7 +47,7 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        db = connect()
+        db = get_db()
         cursor = db.cursor()
         error = None
 
@@ -68,7 +67,6 @@ def login():
 
         flash(error)
         cursor.close()
-        db.close()
 
     return render_template('auth/login.html')
 
@@ -16,47 +16,21 @@ def handle_votes(conn, review_id):
 
         username = session.get("user_id")
 
-        existing_vote = Votes.check_vote(cursor, username, review_id)
-
-        action = ""
-
-        if existing_vote:
-            existing_vote_id = existing_vote[0]
-            existing_vote_type = existing_vote[1]
-
-
-            if existing_vote_type == vote_type:
-                Votes.delete_vote(cursor, existing_vote_id)
-                action += 'removed'
-            else:
-
-                Votes.edit_vote(cursor, existing_vote_id, vote_type)
-                action += 'changed'
-        else:
-
-            Votes.update_vote_id(cursor)
-
-            Votes.create_vote(cursor, review_id, username, vote_type)
-            action += 'added'
+        # add, change or remove the vote and read the new counts in a single round trip
+        action, upvotes, downvotes = Votes.toggle_vote(cursor, review_id, username, vote_type)
 
         conn.commit()
 
-        counts = Votes.count_votes(cursor, review_id)
-
-        cursor.close()
-
-
         return jsonify({
             'success': True,
             'action': action,
-            'upvotes': counts[0] if counts[0] else 0,
-            'downvotes': counts[1] if counts[1] else 0,
+            'upvotes': upvotes,
+            'downvotes': downvotes,
             'message': f'Vote {action} successfully'
         })
 
     except psycopg2.Error as e:
         conn.rollback()
-        cursor.close()
 
         return jsonify({
             'success': False,
@@ -65,7 +39,6 @@ def handle_votes(conn, review_id):
 
     except Exception as e:
         conn.rollback()
-        cursor.close()
 
         return jsonify({
             'success': False,
@@ -73,5 +46,4 @@ def handle_votes(conn, review_id):
         }), 500
 
     finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        cursor.close()
\ No newline at end of file
@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+from ..config.db_notifications import subscribe
+from ..utils.metrics import Histogram, Stopwatch, register
+
+load_dotenv()
+
+# cached answers kept in total, 0 disables the cache
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+# seconds a cached answer is served for
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# minimum cosine similarity between two questions for one to be answered with the other's reply
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+class AnswerCache:
+    """
+        Bounded LRU cache of assistant answers keyed by intent and question embedding.
+
+        A question is answered from the cache when an earlier question with the same intent
+        and scope (the professor names of a comparison) is at least `threshold` cosine
+        similar and its answer is younger than `ttl`. Each intent keeps its unit embeddings
+        in one matrix so a lookup is a single matrix-vector product.
+
+        Every entry remembers the instructors whose reviews went into its prompt. The
+        review_changes channel (triggers on review and review_embeddings) drops the entries
+        of the changed instructor, the course_catalog channel and listener reconnects drop
+        everything. Answers generated from data read before an invalidation are not stored.
+    """
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        # intent -> (entry ids, matrix of their unit embeddings), rebuilt after a change
+        self._matrices = {}
+        self._lock = threading.Lock()
+        self._subscribed = False
+        self._next_id = 0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lookup_ms = Histogram()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _ensure_subscribed(self):
+        if not self._subscribed:
+            with self._lock:
+                if not self._subscribed:
+                    subscribe("review_changes", self._on_review_change)
+                    subscribe("course_catalog", self._on_catalog_change)
+                    self._subscribed = True
+
+    def _on_review_change(self, payload):
+        if payload is None:
+            self.clear()
+            return
+        try:
+            instructor = json.loads(payload)
+        except ValueError:
+            self.clear()
+            return
+        self.invalidate_instructor(instructor["first"], instructor["last"])
+
+    def _on_catalog_change(self, payload):
+        self.clear()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _matrix(self, intent):
+        matrix = self._matrices.get(intent)
+        if matrix is None:
+            ids = [entry_id for entry_id, entry in self._entries.items() if entry["intent"] == intent]
+            vectors = [self._entries[entry_id]["embedding"] for entry_id in ids]
+            matrix = (ids, np.stack(vectors) if vectors else None)
+            self._matrices[intent] = matrix
+        return matrix
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        self._matrices.pop(entry["intent"], None)
+
+    def generation(self):
+        """
+        Token to take before reading the data an answer is generated from and to pass to
+        store(), which ignores the answer if the cache was invalidated in between.
+        """
+        self._ensure_subscribed()
+        return self._generation
+
+    def lookup(self, intent, embedding, scope=None):
+        """
+        Returns the cached answer for the most similar earlier question, or None.
+        """
+        if not self.enabled:
+            return None
+
+        self._ensure_subscribed()
+        timer = Stopwatch()
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            answer = None
+            ids, matrix = self._matrix(intent)
+            if matrix is not None and matrix.shape[1] == query.shape[0]:
+                scores = matrix @ query
+                for position in np.argsort(-scores, kind="stable"):
+                    if scores[position] < self.threshold:
+                        break
+                    entry_id = ids[position]
+                    entry = self._entries[entry_id]
+                    if now - entry["created"] > self.ttl:
+                        continue
+                    if entry["scope"] != scope:
+                        continue
+                    self._entries.move_to_end(entry_id)
+                    answer = entry["answer"]
+                    break
+
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        self.lookup_ms.observe(timer.elapsed_ms())
+        return answer
+
+    def store(self, intent, embedding, answer, instructors=(), scope=None, generation=None):
+        if not self.enabled or not answer:
+            return
+
+        self._ensure_subscribed()
+        now = time.monotonic()
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            for entry_id in [entry_id for entry_id, entry in self._entries.items()
+                             if now - entry["created"] > self.ttl]:
+                self._remove(entry_id)
+
+            while len(self._entries) >= self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            self._entries[self._next_id] = {
+                "intent": intent,
+                "scope": scope,
+                "embedding": self._normalize(embedding),
+                "answer": answer,
+                "instructors": frozenset(instructors),
+                "created": now,
+            }
+            self._next_id += 1
+            self._matrices.pop(intent, None)
+            self.stores += 1
+
+    def invalidate_instructor(self, first, last):
+        with self._lock:
+            self._generation += 1
+            stale = [entry_id for entry_id, entry in self._entries.items()
+                     if (first, last) in entry["instructors"]]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._matrices.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "lookup_ms": self.lookup_ms.snapshot(),
+        }
+
+
+_cache = AnswerCache()
+
+
+def get_answer_cache() -> AnswerCache:
+    return _cache
+
+
+register("answer_cache", _cache.stats)
@@ -1,15 +1,39 @@
 import psycopg2
 from tqdm import tqdm
 from ..models.intructors import Instructor
-from ..config.db_connection import connect
+from ..config.db_connection import borrow
+from ..config.vector_indexes import search_settings
+from ..config.embedding_storage import with_embedding_type
 from ..utils.helper import validate_instructor
 from ..utils.query_parser import  extract_two_prof_names
-from sentence_transformers import SentenceTransformer
-from ..models.context_pydantic import CourseContext, CourseRecommendationContext, ProfessorComparisonContext, ReviewContext, MiscellaneousInfoContext
-from transformers import pipeline
+from .embeddings import get_embedding_service
+from .inference import get_inference_executor
+from .course_index import get_course_index, COURSE_INDEX_IN_MEMORY
+from .conversations import ConversationMemory, CONVERSATION_SUMMARY, CONVERSATION_SUMMARY_TOKENS
+from .answer_cache import get_answer_cache
+from .prefix_cache import PrefixCache, PREFIX_CACHE
+from .quantization import INFERENCE_BACKEND, load_generation_pipeline
+from ..utils.metrics import Histogram, register
+from ..models.context_pydantic import ContextBuilder, CourseContext, CourseRecommendationContext, ProfessorComparisonContext, ReviewContext, MiscellaneousInfoContext
 from dotenv import load_dotenv
+import asyncio
 import json
+import os
+import queue
 import re
+import threading
+import time
+from collections import defaultdict
+
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "8"))
+# consensus summaries, the same settings for the single and the batched path
+SUMMARY_MAX_NEW_TOKENS = int(os.getenv("SUMMARY_MAX_NEW_TOKENS", "300"))
+# tokens of review comments in a summary prompt, newest comments first
+SUMMARY_COMMENT_TOKENS = int(os.getenv("SUMMARY_COMMENT_TOKENS", "3000"))
+# seconds between deadline checks while waiting for the next streamed token
+STREAM_POLL_INTERVAL = 1.0
+# bucket upper bounds for the prompt context size, in tokens
+CONTEXT_TOKEN_BUCKETS = (128, 256, 512, 768, 1024, 1536, 2048, 4096)
 
 
 class AssistantRoles:
@@ -27,29 +51,96 @@ class AssistantRoles:
     def __init__(self):
         load_dotenv()
         with open("./app/utils/assistant_queries.json", "r") as file:
-            self.assistant_queries = json.load(file)
+            self.assistant_queries = with_embedding_type(json.load(file))
 
         with open("./app/utils/prompts.json", "r") as file:
             self.prompts = json.load(file)
         self.model_id="meta-llama/Llama-3.2-1B-Instruct"
+        self.backend = INFERENCE_BACKEND
         self.system_prompt=self.prompts["system_prompt"]
-        self.embedding_model = SentenceTransformer("google/embeddinggemma-300m")
-        self.pipe = pipeline(
-                "text-generation",
-                model=self.model_id,
-                dtype="auto",
-                device_map="auto",
-                )
-        self.messages =[
-            {"role": "system", "content": self.system_prompt}
-        ]
-
-
-    def get_database_results_for_relevant_reviews(self, cursor, user_query:str):
-        query_embedding = self.embedding_model.encode_query(user_query)
+        self.embedding_model = get_embedding_service()
+        self._pipe = None
+        self._load_lock = threading.Lock()
+        self.load_state = "not_loaded"
+        self.memory = ConversationMemory(
+            count_tokens=self.count_tokens,
+            summarizer=self.summarize_turns if CONVERSATION_SUMMARY else None,
+        )
+        register("conversations", self.memory.stats)
+        self._prefix_cache = None
+        register("prefix_cache", self.prefix_cache_stats)
+        self._context_stats = defaultdict(lambda: {"tokens": Histogram(CONTEXT_TOKEN_BUCKETS), "dropped": 0, "truncated": 0})
+        register("context", self.context_stats)
+
+
+    @property
+    def pipe(self):
+        """
+        The text-generation pipeline, loaded on first use so importing this module and
+        building AssistantRoles stay cheap.
+        """
+        if self._pipe is None:
+            with self._load_lock:
+                if self._pipe is None:
+                    self.load_state = "loading"
+                    try:
+                        print(f"loading text-generation model {self.model_id} ({self.backend})")
+                        self._pipe = load_generation_pipeline(self.model_id, self.backend)
+                    except Exception:
+                        self.load_state = "failed"
+                        raise
+                    self.load_state = "loaded"
+        return self._pipe
+
+    @property
+    def prefix_cache(self) -> PrefixCache:
+        if self._prefix_cache is None:
+            pipe = self.pipe
+            with self._load_lock:
+                if self._prefix_cache is None:
+                    templates = {key[:-len("_prompt")]: prompt for key, prompt in self.prompts.items()
+                                 if key.endswith("_prompt") and key != "system_prompt"}
+                    self._prefix_cache = PrefixCache(pipe, self.system_prompt, templates)
+        return self._prefix_cache
+
+    def prefix_cache_stats(self):
+        if self._prefix_cache is None:
+            return {"enabled": PREFIX_CACHE, "prefixes": 0, "intents": {}}
+        return self._prefix_cache.stats()
+
+    def format_context(self, intent: str, context) -> str:
+        """
+        Formats a prompt context so that the prompt, with the system prompt and the intent's
+        instructions, stays within CONTEXT_MAX_TOKENS, and records its size per intent.
+        The conversation history has its own budget, CONVERSATION_MAX_TOKENS.
+        """
+        instructions = self.prompts[f"{intent}_prompt"].replace("{formatted_context}", "")
+        builder = ContextBuilder(self.count_tokens,
+                                 reserved_tokens=self.count_tokens(self.system_prompt) + self.count_tokens(instructions))
+        formatted_context = context.format_for_llm(builder)
+
+        stats = self._context_stats[intent]
+        stats["tokens"].observe(builder.tokens)
+        stats["dropped"] += builder.dropped
+        stats["truncated"] += builder.truncated
+        print(f"[CONTEXT] {intent}: {builder.tokens} tokens, {builder.included} items, "
+              f"{builder.dropped} dropped, {builder.truncated} truncated")
+        return formatted_context
+
+    def context_stats(self):
+        return {intent: {"tokens": stats["tokens"].snapshot(), "dropped": stats["dropped"],
+                         "truncated": stats["truncated"]}
+                for intent, stats in list(self._context_stats.items())}
+
+    def embed_query(self, user_query: str):
+        return self.embedding_model.encode_query_cached(user_query)
+
+    def get_database_results_for_relevant_reviews(self, cursor, query_embedding):
 
         try:
-            cursor.execute(self.assistant_queries["relevant_reviews_query"], ((query_embedding.tolist(),)))
+            settings, settings_params = search_settings()
+            cursor.execute(settings + self.assistant_queries["relevant_reviews_query"],
+                           settings_params + (query_embedding,))
 
             return cursor.fetchall()
         except psycopg2.ProgrammingError as e:
@@ -57,20 +148,48 @@ class AssistantRoles:
             return None
 
 
-    def get_database_results_for_curriculum(self, cursor, user_query:str):
+    def get_database_results_for_curriculum(self, cursor, query_embedding):
 
-        query_embedding = self.embedding_model.encode_query(user_query)
+        if COURSE_INDEX_IN_MEMORY:
+            try:
+                return get_course_index().search(query_embedding)
+            except psycopg2.Error as e:
+                print(f"Error loading the course index, querying the database instead: {e}")
 
 
-        query = self.assistant_queries["curriculum_query"]
+        settings, settings_params = search_settings()
+        query = settings + self.assistant_queries["curriculum_query"]
         try:
-            cursor.execute(query, (query_embedding.tolist(),))
+            cursor.execute(query, settings_params + (query_embedding,))
             courses = cursor.fetchall()
             return courses
         except psycopg2.ProgrammingError as e:
             print(f"Error: {e}")
             return None
 
+    def get_database_results_for_qna(self, cursor, query_embedding):
+        """
+        Relevant reviews and courses for a question in a single round trip. With the in-memory
+        course index only reviews need the database, otherwise one statement ranks both tables
+        and tags each row with its source.
+        """
+        if COURSE_INDEX_IN_MEMORY:
+            return (self.get_database_results_for_relevant_reviews(cursor, query_embedding),
+                    self.get_database_results_for_curriculum(cursor, query_embedding))
+
+        settings, settings_params = search_settings()
+        try:
+            cursor.execute(settings + self.assistant_queries["qna_retrieval_query"],
+                           settings_params + (query_embedding,))
+            rows = cursor.fetchall()
+        except psycopg2.ProgrammingError as e:
+            print(f"Error: {e}")
+            return None, None
+
+        reviews = [row[1:5] for row in rows if row[0] == "review"]
+        courses = [row[3:5] for row in rows if row[0] == "course"]
+        return reviews, courses
+
     def get_database_results_for_profcomparison(self, cursor, prof1_fname:str, prof1_lname:str, prof2_fname:str, prof2_lname:str):
 
 
@@ -99,66 +218,292 @@ class AssistantRoles:
             return None, None
 
 
-    async def chat(self, messages: list[str]):
+    def count_tokens(self, text: str) -> int:
+        return len(self.pipe.tokenizer.encode(text, add_special_tokens=False))
 
+    def build_conversation(self, messages: list[str], summary: str = None, history: list = ()):
+        """
+        Turns the prompt parts into a chat for the pipeline: the system prompt (with the summary
+        of earlier turns, if any), the session's recent turns, then one user turn holding every part.
+        """
+        system_prompt = self.system_prompt
+        if summary:
+            system_prompt += f"\n\nSummary of the earlier conversation with this student: {summary}"
 
-        self.messages.append(
-            {"role": "user", "content": ("\n".join(messages))},
-        )
+        return [
+            {"role": "system", "content": system_prompt},
+            *history,
+            {"role": "user", "content": "\n".join(messages)},
+        ]
 
-        outputs = self.pipe(
-            messages,
-            max_new_tokens=900,
-            temperature=0.1,
-            return_full_text=False,
+    def summarize_turns(self, summary: str, turns: list):
+        """
+        Rolling summary for ConversationMemory: folds the turns dropped from a session's
+        history into its previous summary.
+        """
+        prompt = self.prompts["conversation_summary_prompt"].format(
+            previous_summary=f"Earlier summary: {summary}" if summary else "",
+            turns="\n".join(f"Student: {question}\nAssistant: {reply}" for question, reply in turns),
         )
+        conversation = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": prompt},
+        ]
 
-        assistant_reply = outputs[0][-1]["generated_text"].strip()
-        assistant_reply = re.sub(r'\*\*', '', assistant_reply)
-        assistant_reply = re.sub(r'\*', '', assistant_reply)
+        executor = get_inference_executor()
+        deadline = executor.deadline()
+        outputs = executor.run(self._generate, conversation, deadline, max_new_tokens=CONVERSATION_SUMMARY_TOKENS,
+                               deadline=deadline)
+        return self.clean_reply(outputs[0]["generated_text"])
+
+    @staticmethod
+    def clean_reply(reply: str):
+        reply = reply.strip()
+        reply = re.sub(r'\*\*', '', reply)
+        reply = re.sub(r'\*', '', reply)
+        return reply
+
+    def _generate(self, conversation, deadline: float = None, streamer=None, max_new_tokens: int = 900):
+        """
+        Runs the model on an inference worker, reusing the cached key/values of the prompt's
+        static start when PREFIX_CACHE is on. Generation is capped at the time left until
+        the request's deadline so an abandoned request frees the model.
+        """
+        kwargs = {}
+        if deadline is not None:
+            kwargs["max_time"] = max(deadline - time.monotonic(), 1.0)
+        if streamer is not None:
+            kwargs["streamer"] = streamer
 
-        self.messages.append(
-            {"role": "assistant", "content": assistant_reply},
-        )
+        try:
+            if PREFIX_CACHE:
+                return self.prefix_cache.generate(conversation, max_new_tokens=max_new_tokens, temperature=0.1,
+                                                  **kwargs)
+            return self.pipe(
+                conversation,
+                max_new_tokens=max_new_tokens,
+                temperature=0.1,
+                return_full_text=False,
+                **kwargs,
+            )
+        except Exception:
+            if streamer is not None:
+                # unblock the consumer, it raises the error from the future
+                streamer.end()
+            raise
+
+    def reply(self, messages: list[str], session_id=None, question: str = None):
+        """
+        Blocking chat completion through the inference executor. Raises InferenceQueueFull
+        when the queue is full and InferenceTimeout when the deadline passes.
+
+        With a session_id the session's history is part of the prompt and the question
+        (the user's own words, without retrieved context) and reply are added to it.
+        """
+        summary, history = self.memory.history(session_id)
+
+        executor = get_inference_executor()
+        deadline = executor.deadline()
+        outputs = executor.run(self._generate, self.build_conversation(messages, summary, history), deadline,
+                               deadline=deadline)
+
+        assistant_reply = self.clean_reply(outputs[0]["generated_text"])
+
+        if question:
+            self.memory.append(session_id, question, assistant_reply)
         print(assistant_reply)
         return assistant_reply
 
-    def create_summary_prompt(self, contents: list[str]):
+    def chat_stream(self, messages: list[str], session_id=None, question: str = None):
+        """
+        Streaming version of reply(). The request is queued on the inference executor right
+        away, so a full queue raises here, and the returned generator yields the reply text
+        as it is decoded with the same markdown stripping as clean_reply.
+        """
+        from transformers import TextIteratorStreamer
+
+        summary, history = self.memory.history(session_id)
+
+        executor = get_inference_executor()
+        deadline = executor.deadline()
+        streamer = TextIteratorStreamer(self.pipe.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                        timeout=STREAM_POLL_INTERVAL)
+        future = executor.submit(self._generate, self.build_conversation(messages, summary, history), deadline,
+                                 streamer, deadline=deadline)
+
+        return self._stream_reply(executor, future, streamer, deadline, session_id, question)
+
+    def _stream_reply(self, executor, future, streamer, deadline, session_id, question):
+        reply = []
+        while True:
+            try:
+                chunk = next(streamer)
+            except StopIteration:
+                break
+            except queue.Empty:
+                # still queued or between tokens, give up once the deadline has passed
+                if future.done() or (deadline is not None and time.monotonic() >= deadline):
+                    executor.wait(future, deadline)
+                    break
+                continue
+
+            chunk = chunk.replace("*", "")
+            if not reply:
+                chunk = chunk.lstrip()
+            if chunk:
+                reply.append(chunk)
+                yield chunk
+
+        # raises the generation error, if any
+        executor.wait(future, deadline)
+
+        assistant_reply = "".join(reply).rstrip()
+        if question:
+            self.memory.append(session_id, question, assistant_reply)
+        print(assistant_reply)
+
+    def generate_batch(self, conversations: list, batch_size: int = SUMMARY_BATCH_SIZE,
+                       max_new_tokens: int = SUMMARY_MAX_NEW_TOKENS):
+        """
+        Generates replies for many conversations with padded batches. Conversations are sorted
+        by prompt length first so each batch pads to a similar length, replies come back in
+        the original order.
+        """
+        tokenizer = self.pipe.tokenizer
+        if tokenizer.pad_token_id is None:
+            tokenizer.pad_token_id = tokenizer.eos_token_id
+        tokenizer.padding_side = "left"
+
+        lengths = [len(tokenizer.apply_chat_template(conversation, tokenize=True)) for conversation in conversations]
+        order = sorted(range(len(conversations)), key=lambda i: lengths[i])
+
+        outputs = get_inference_executor().run(
+            self.pipe,
+            [conversations[i] for i in order],
+            batch_size=batch_size,
+            max_new_tokens=max_new_tokens,
+            temperature=0.1,
+            return_full_text=False,
+        )
+
+        replies = [None] * len(conversations)
+        for i, output in zip(order, outputs):
+            replies[i] = self.clean_reply(output[0]["generated_text"])
+        return replies
+
+    def create_summary_prompt(self, comments: list[str], budget: int = SUMMARY_COMMENT_TOKENS):
+        """
+        The summary prompt followed by the comments, newest first, that fit into budget tokens.
+        """
         messages = []
 
         messages.append(self.prompts["summary_prompt"])
-        for content in contents[0]:
-            messages.append(content)
+        for comment in comments:
+            budget -= self.count_tokens(comment)
+            if budget < 0:
+                break
+            messages.append(comment)
 
         return messages
 
-    async def generate_consensus_summary(self, instructor_first: str, instructor_last: str):
-        conn = connect()
-        try:
-            comments = Instructor.get_all_comments_for_instructor(conn.cursor(), instructor_first, instructor_last)
-
-            if not comments:
-                return "No reviews yet"
+    def summarize(self, conversation):
+        executor = get_inference_executor()
+        deadline = executor.deadline()
+        outputs = executor.run(self._generate, conversation, deadline, max_new_tokens=SUMMARY_MAX_NEW_TOKENS,
+                               deadline=deadline)
+        return self.clean_reply(outputs[0]["generated_text"])
 
-            else:
-                messages = self.create_summary_prompt(comments)
+    async def generate_consensus_summary(self, instructor_first: str, instructor_last: str):
+        with borrow() as conn:
+            cursor = conn.cursor()
+            try:
+                comments = Instructor.get_all_comments_for_instructor(cursor, instructor_first, instructor_last)
+            finally:
+                cursor.close()
 
-                result = await self.chat(messages)
-                return result
-        finally:
-            conn.close()
+        if not comments:
+            return "No reviews yet"
 
+        else:
+            conversation = self.build_conversation(self.create_summary_prompt([row[0] for row in comments]))
+
+            return await asyncio.to_thread(self.summarize, conversation)
+
+    def get_comments_for_all_instructors(self, cursor):
+        """
+        Prefetches every review comment in one query, grouped by (first, last) instructor name.
+        """
+        cursor.execute(self.assistant_queries["all_instructor_comments_query"])
+
+        comments = defaultdict(list)
+        for instructor_first, instructor_last, comment in cursor.fetchall():
+            comments[(instructor_first, instructor_last)].append(comment)
+        return comments
+
+    def generate_summaries_batch(self, rows, comments, batch_size: int = SUMMARY_BATCH_SIZE):
+        """
+        Generates consensus summaries for the (first, last) instructor rows from prefetched comments.
+        """
+        results = {}
+        keys = [(row[0], row[1]) for row in rows if comments.get((row[0], row[1]))]
+
+        conversations = [self.build_conversation(self.create_summary_prompt(comments[key])) for key in keys]
+        if conversations:
+            for key, summary in zip(keys, self.generate_batch(conversations, batch_size)):
+                results[key] = summary
+
+        return [{"first": row[0], "last": row[1], "summary": results.get((row[0], row[1]), "No reviews yet")}
+                for row in rows]
+
+    async def generate_summary_for_all_instructors(self, rows, batch_size: int = SUMMARY_BATCH_SIZE):
+        with borrow() as conn:
+            cursor = conn.cursor()
+            try:
+                comments = self.get_comments_for_all_instructors(cursor)
+            finally:
+                cursor.close()
 
-    async def generate_summary_for_all_instructors(self,rows):
         results = []
-        for row in tqdm(rows, total=len(rows)):
-            result = await self.generate_consensus_summary(row[0], row[1])
-            results.append({"first": row[0], "last": row[1], "summary": result})
+        for start in tqdm(range(0, len(rows), batch_size), desc="Generating summaries"):
+            results.extend(self.generate_summaries_batch(rows[start:start + batch_size], comments, batch_size))
         return results
 
-    async def recommend_curriculum(self, cursor, user_query: str):
-
-        database_results = self.get_database_results_for_curriculum(cursor, user_query)
+    @staticmethod
+    def answer_scope(intent: str, user_query: str):
+        # comparisons of different professors read alike, so their names are part of the key
+        if intent != "compare":
+            return None
+        prof_names = extract_two_prof_names(user_query)
+        return tuple(sorted(name.lower() for name in prof_names)) if prof_names else None
+
+    def is_follow_up(self, session_id) -> bool:
+        summary, history = self.memory.history(session_id)
+        return bool(summary or history)
+
+    def cached_reply(self, intent: str, user_query: str, session_id=None):
+        """
+        The answer to an earlier question similar enough to this one, or None. A cached answer
+        is added to the session's history like a generated one. Only the first question of a
+        conversation should be looked up, a follow-up's answer depends on the history.
+        """
+        answer = get_answer_cache().lookup(intent, self.embed_query(user_query),
+                                           self.answer_scope(intent, user_query))
+        if answer is not None and session_id is not None:
+            self.memory.append(session_id, user_query, answer)
+        return answer
+
+    def cache_reply(self, intent: str, user_query: str, answer: str, instructors=(), generation=None):
+        """
+        Stores a generated answer. instructors are the (first, last) names whose reviews were in
+        the prompt and generation the answer cache generation taken before retrieval.
+        """
+        get_answer_cache().store(intent, self.embed_query(user_query), answer, instructors,
+                                 self.answer_scope(intent, user_query), generation)
+
+    def build_curriculum_messages(self, cursor, user_query: str):
+
+        query_embedding = self.embed_query(user_query)
+        database_results = self.get_database_results_for_curriculum(cursor, query_embedding)
         formatted_context = ""
         if not database_results:
             formatted_context += "No courses found related your field"
@@ -176,18 +521,16 @@ class AssistantRoles:
                 matching_courses=course_contexts,
             )
 
-            formatted_context += context.format_for_llm()
-
-        messages = [self.prompts["curriculum_prompt"].format(formatted_context=formatted_context)]
-
+            formatted_context += self.format_context("curriculum", context)
 
-        return await self.chat(messages)
+        # course descriptions only, no instructor's reviews
+        return [self.prompts["curriculum_prompt"].format(formatted_context=formatted_context)], set()
 
-    async def QnA(self, cursor, user_query: str):
+    def build_qna_messages(self, cursor, user_query: str):
 
-        relevant_reviews_rows = self.get_database_results_for_relevant_reviews(cursor, user_query)
+        query_embedding = self.embed_query(user_query)
 
-        relevant_courses_rows = self.get_database_results_for_curriculum(cursor, user_query)
+        relevant_reviews_rows, relevant_courses_rows = self.get_database_results_for_qna(cursor, query_embedding)
 
         if not relevant_reviews_rows:
             message = "no reviews yet"
@@ -225,15 +568,12 @@ class AssistantRoles:
             relevant_courses=course_context
         )
 
-        formatted_context = context.format_for_llm()
+        formatted_context = self.format_context("qna", context)
 
-        messages = [self.prompts["qna_prompt"].format(formatted_context=formatted_context)]
+        instructors = {(row[0], row[1]) for row in relevant_reviews_rows or ()}
+        return [self.prompts["qna_prompt"].format(formatted_context=formatted_context)], instructors
 
-
-        return await self.chat(messages)
-
-
-    async def compare_two_professors(self, cursor, user_query: str):
+    def build_comparison_messages(self, cursor, user_query: str):
 
         prof_names = extract_two_prof_names(user_query)
         print(prof_names)
@@ -326,11 +666,24 @@ class AssistantRoles:
             professor2_courses=prof2_course_context
         )
 
-        formatted_context = context.format_for_llm()
+        formatted_context = self.format_context("comparison", context)
 
-        messages = [self.prompts["comparison_prompt"].format(formatted_context=formatted_context)]
+        instructors = {(prof1_fname, prof1_lname), (prof2_fname, prof2_lname)}
+        return [self.prompts["comparison_prompt"].format(formatted_context=formatted_context)], instructors
 
-        return await self.chat(messages)
 
+_assistant_roles = None
+_assistant_roles_lock = threading.Lock()
 
 
+def get_assistant_roles() -> AssistantRoles:
+    """
+    Returns the process-wide AssistantRoles instance so the LLM pipeline is only loaded once.
+    Building it does not load any model, that happens on first generation.
+    """
+    global _assistant_roles
+    if _assistant_roles is None:
+        with _assistant_roles_lock:
+            if _assistant_roles is None:
+                _assistant_roles = AssistantRoles()
+    return _assistant_roles
@@ -1,5 +1,16 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Callable, List, Optional
+from collections import Counter
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# tokens a prompt may take: system prompt, instructions, question and the retrieved context,
+# reviews and courses past it are left out
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2048"))
+# longer reviews and course descriptions are cut to this many tokens
+CONTEXT_MAX_ITEM_TOKENS = int(os.getenv("CONTEXT_MAX_ITEM_TOKENS", "160"))
 
 
 class CourseContext(BaseModel):
@@ -28,6 +39,127 @@ class ReviewContext(BaseModel):
 
 
 
+class Section:
+    """
+        Ranked items of one context section, best first, each written out with line_format.
+    """
+
+    def __init__(self, items: List[str], line_format: str = "{}\n"):
+        self.items = items
+        self.line_format = line_format
+
+
+class UserText:
+    """
+        Text typed by the user, e.g. the question. Counted like fixed text, but cut to what is
+        left of the budget when it alone would not fit.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class ContextBuilder:
+    """
+        Joins fixed text, user text and ranked sections into a prompt context that fits a
+        token budget.
+
+        reserved_tokens of max_tokens are taken by the prompt around the context (system
+        prompt and the intent's instructions), then the fixed text is counted and the user
+        text cut to the rest. Items longer than max_item_tokens are cut at a word boundary.
+        Sections are then filled round-robin in rank order, so every section gets its best
+        items before any gets its next ones, until the next item of a section no longer fits.
+        Without count_tokens nothing is cut or left out.
+
+        After build(), tokens holds the token count of the context and included/dropped the
+        number of items kept and left out.
+    """
+
+    def __init__(self, count_tokens: Optional[Callable[[str], int]] = None,
+                 max_tokens: int = CONTEXT_MAX_TOKENS, max_item_tokens: int = CONTEXT_MAX_ITEM_TOKENS,
+                 reserved_tokens: int = 0):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.max_item_tokens = max_item_tokens
+        self.reserved_tokens = reserved_tokens
+        self.tokens = None
+        self.included = 0
+        self.dropped = 0
+        self.truncated = 0
+
+    def truncate(self, text: str, limit: int = None) -> str:
+        limit = self.max_item_tokens if limit is None else limit
+        tokens = self.count_tokens(text)
+        if tokens <= limit:
+            return text
+
+        self.truncated += 1
+        original, keep = text, len(text)
+        while tokens > limit and keep > 0:
+            # cut proportionally, then back to the last whole word
+            keep = int(keep * limit / tokens * 0.95)
+            text = original[:keep].rsplit(" ", 1)[0] + "..."
+            tokens = self.count_tokens(text)
+        return text
+
+    def build(self, parts: list) -> str:
+        sections = [part for part in parts if isinstance(part, Section)]
+        chosen = {id(section): [] for section in sections}
+        texts = {id(part): part.text for part in parts if isinstance(part, UserText)}
+
+        if self.count_tokens is None:
+            for section in sections:
+                chosen[id(section)] = [section.line_format.format(item) for item in section.items]
+        else:
+            used = self.reserved_tokens + sum(self.count_tokens(part) for part in parts if isinstance(part, str))
+            for key, text in texts.items():
+                # a question longer than the whole budget would push the prompt past it on its own
+                texts[key] = self.truncate(text, max(self.max_tokens - used, 1))
+                used += self.count_tokens(texts[key])
+            pending = {id(section): list(section.items) for section in sections}
+            active = [section for section in sections if section.items]
+            while active:
+                for section in list(active):
+                    items = pending[id(section)]
+                    line = section.line_format.format(self.truncate(items.pop(0)))
+                    cost = self.count_tokens(line)
+                    if used + cost > self.max_tokens:
+                        # keep the ranking, a lower ranked item never replaces one that did not fit
+                        self.dropped += 1 + len(items)
+                        items.clear()
+                    else:
+                        chosen[id(section)].append(line)
+                        used += cost
+                    if not items:
+                        active.remove(section)
+
+        lines = []
+        for part in parts:
+            if isinstance(part, Section):
+                lines.extend(chosen[id(part)])
+            elif isinstance(part, UserText):
+                lines.append(texts[id(part)])
+            else:
+                lines.append(part)
+
+        self.included = sum(len(items) for items in chosen.values())
+        context = "".join(lines)
+        if self.count_tokens is not None:
+            self.tokens = self.count_tokens(context)
+        return context
+
+
+def rank_courses(courses: List[CourseContext]) -> List[CourseContext]:
+    """
+    One entry per course, the courses with the most sections first.
+    """
+    sections = Counter(course.course_code for course in courses)
+    unique = {}
+    for course in courses:
+        unique.setdefault(course.course_code, course)
+    return sorted(unique.values(), key=lambda course: -sections[course.course_code])
+
+
 class ProfessorComparisonContext(BaseModel):
     """
         Class to build context for comparison between two professors.
@@ -42,26 +174,20 @@ class ProfessorComparisonContext(BaseModel):
     professor2_courses: List[CourseContext]
     professor2_reviews: List[ReviewContext]
 
-    def format_for_llm(self) -> str:
-
-        context = f"PROFESSOR 1: {self.professor1_fname} {self.professor1_lname}\n"
-        context += "Reviews:\n"
-        for review in self.professor1_reviews:
-            context += f"  - {review.format()}\n"
-        context += "Current courses taught by professor:\n"
-        for course in self.professor1_courses:
-            context += f"  - {course.format()}\n"
-
-
-        context += f"\nPROFESSOR 2: {self.professor2_fname} {self.professor2_lname}\n"
-        context += "Reviews:\n"
-        for review in self.professor2_reviews:
-            context += f"  - {review.format()}\n"
-        context += "Current courses taught by professor:\n"
-        for course in self.professor2_courses:
-            context += f"  - {course.format()}\n"
-
-        return context
+    def format_for_llm(self, builder: ContextBuilder = None) -> str:
+        builder = builder or ContextBuilder()
+        return builder.build([
+            f"PROFESSOR 1: {self.professor1_fname} {self.professor1_lname}\n",
+            "Reviews:\n",
+            Section([review.format() for review in self.professor1_reviews], "  - {}\n"),
+            "Current courses taught by professor:\n",
+            Section([course.format() for course in rank_courses(self.professor1_courses)], "  - {}\n"),
+            f"\nPROFESSOR 2: {self.professor2_fname} {self.professor2_lname}\n",
+            "Reviews:\n",
+            Section([review.format() for review in self.professor2_reviews], "  - {}\n"),
+            "Current courses taught by professor:\n",
+            Section([course.format() for course in rank_courses(self.professor2_courses)], "  - {}\n"),
+        ])
 
 
 class CourseRecommendationContext(BaseModel):
@@ -72,13 +198,15 @@ class CourseRecommendationContext(BaseModel):
     user_preferences: str
     matching_courses: List[CourseContext]
 
-    def format_for_llm(self) -> str:
-        context = f"User is looking to study: {self.user_preferences}\n\n"
-        context += "Relevant Courses:\n"
-        for course in self.matching_courses:
-            context += f"\n{course.format()}:\n"
-
-        return context
+    def format_for_llm(self, builder: ContextBuilder = None) -> str:
+        builder = builder or ContextBuilder()
+        return builder.build([
+            "User is looking to study: ",
+            UserText(self.user_preferences),
+            "\n\n",
+            "Relevant Courses:\n",
+            Section([course.format() for course in self.matching_courses], "\n{}:\n"),
+        ])
 
 
 class MiscellaneousInfoContext(BaseModel):
@@ -89,19 +217,14 @@ class MiscellaneousInfoContext(BaseModel):
     relevant_courses: List[CourseContext]
     relevant_reviews: List[ReviewContext]
 
-    def format_for_llm(self) -> str:
-        context = (f"User question: {self.question}\n:")
-        context += "Relevant Courses:\n"
-        for course in self.relevant_courses:
-            context += f"\n{course.format()}:\n"
-        context += "Reviews:\n"
-        for review in self.relevant_reviews:
-            context += f"{review.format()}\n"
-
-        return context
-
-
-
-
-
-
+    def format_for_llm(self, builder: ContextBuilder = None) -> str:
+        builder = builder or ContextBuilder()
+        return builder.build([
+            "User question: ",
+            UserText(self.question),
+            "\n:",
+            "Relevant Courses:\n",
+            Section([course.format() for course in self.relevant_courses], "\n{}:\n"),
+            "Reviews:\n",
+            Section([review.format() for review in self.relevant_reviews], "{}\n"),
+        ])
@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# tokens of history kept per conversation, oldest turns are dropped first
+CONVERSATION_MAX_TOKENS = int(os.getenv("CONVERSATION_MAX_TOKENS", "1024"))
+# conversations kept in memory, least recently used ones are evicted first
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+# seconds of inactivity after which a conversation is forgotten
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "1800"))
+# fold dropped turns into a rolling summary instead of discarding them (costs one extra generation)
+CONVERSATION_SUMMARY = os.getenv("CONVERSATION_SUMMARY", "0") == "1"
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "200"))
+
+
+def estimate_tokens(text: str) -> int:
+    # rough count used when no tokenizer is given, about four characters per token
+    return len(text) // 4 + 1
+
+
+class _Conversation:
+    __slots__ = ("turns", "tokens", "summary", "summary_tokens", "last_used")
+
+    def __init__(self):
+        self.turns = deque()
+        self.tokens = 0
+        self.summary = None
+        self.summary_tokens = 0
+        self.last_used = time.monotonic()
+
+
+class ConversationMemory:
+    """
+        Chat history per session, bounded in both directions.
+
+        Each conversation keeps its most recent (question, reply) turns within max_tokens;
+        older turns are dropped, or folded into a rolling summary when a summarizer is
+        given. Conversations idle for longer than ttl are forgotten and at most
+        max_sessions are kept, least recently used first out, so memory stays flat no
+        matter how many chats have been served.
+    """
+
+    def __init__(self, max_tokens: int = CONVERSATION_MAX_TOKENS, max_sessions: int = CONVERSATION_MAX_SESSIONS,
+                 ttl: float = CONVERSATION_TTL, count_tokens=estimate_tokens, summarizer=None,
+                 summary_tokens: int = CONVERSATION_SUMMARY_TOKENS):
+        self.max_tokens = max_tokens
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.count_tokens = count_tokens
+        self.summarizer = summarizer
+        self.summary_tokens = summary_tokens
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.counters = {"expired": 0, "evicted": 0, "turns_dropped": 0, "summaries": 0,
+                         "summaries_truncated": 0}
+
+    def _expire(self, now):
+        # ordered by last use, so expired conversations are all at the front
+        while self._conversations:
+            session_id, conversation = next(iter(self._conversations.items()))
+            if now - conversation.last_used <= self.ttl:
+                break
+            del self._conversations[session_id]
+            self.counters["expired"] += 1
+
+    def history(self, session_id):
+        """
+        Returns (summary, turns) for the session, where turns is a list of chat messages in
+        order. Unknown or expired sessions have no summary and no turns.
+        """
+        if session_id is None:
+            return None, []
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            conversation = self._conversations.get(session_id)
+            if conversation is None:
+                return None, []
+
+            conversation.last_used = now
+            self._conversations.move_to_end(session_id)
+
+            messages = []
+            for question, reply, _ in conversation.turns:
+                messages.append({"role": "user", "content": question})
+                messages.append({"role": "assistant", "content": reply})
+            return conversation.summary, messages
+
+    def append(self, session_id, question: str, reply: str):
+        if session_id is None:
+            return
+
+        tokens = self.count_tokens(question) + self.count_tokens(reply)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            conversation = self._conversations.get(session_id)
+            if conversation is None:
+                conversation = self._conversations[session_id] = _Conversation()
+                while len(self._conversations) > self.max_sessions:
+                    self._conversations.popitem(last=False)
+                    self.counters["evicted"] += 1
+
+            conversation.last_used = now
+            self._conversations.move_to_end(session_id)
+            conversation.turns.append((question, reply, tokens))
+            conversation.tokens += tokens
+
+            dropped = []
+            while conversation.turns and conversation.tokens + conversation.summary_tokens > self.max_tokens:
+                turn = conversation.turns.popleft()
+                conversation.tokens -= turn[2]
+                dropped.append(turn)
+            self.counters["turns_dropped"] += len(dropped)
+            summary = conversation.summary
+
+        if dropped and self.summarizer is not None:
+            self._fold(session_id, summary, dropped)
+
+    def _truncate(self, text, tokens):
+        """
+        Cuts text to summary_tokens, proportionally and then back to the last whole word.
+        """
+        original, keep = text, len(text)
+        while tokens > self.summary_tokens and keep > 0:
+            keep = int(keep * self.summary_tokens / tokens * 0.95)
+            text = original[:keep].rsplit(" ", 1)[0] + "..."
+            tokens = self.count_tokens(text)
+        return text
+
+    def _fold(self, session_id, summary, dropped):
+        """
+        Replaces the session's summary with one covering the dropped turns as well, run
+        outside the lock since the summarizer generates text.
+        """
+        try:
+            new_summary = self.summarizer(summary, [(question, reply) for question, reply, _ in dropped])
+        except Exception as e:
+            print(f"[conversations] could not summarize dropped turns: {e}")
+            return
+
+        if not new_summary:
+            return
+        new_tokens = self.count_tokens(new_summary)
+        if new_tokens > self.summary_tokens:
+            # keep what fits rather than losing the earlier conversation altogether
+            new_summary = self._truncate(new_summary, new_tokens)
+            new_tokens = self.count_tokens(new_summary)
+            self.counters["summaries_truncated"] += 1
+
+        with self._lock:
+            conversation = self._conversations.get(session_id)
+            if conversation is None:
+                return
+            conversation.summary = new_summary
+            conversation.summary_tokens = new_tokens
+            self.counters["summaries"] += 1
+            while conversation.turns and conversation.tokens + conversation.summary_tokens > self.max_tokens:
+                turn = conversation.turns.popleft()
+                conversation.tokens -= turn[2]
+                self.counters["turns_dropped"] += 1
+
+    def forget(self, session_id):
+        with self._lock:
+            self._conversations.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            stats = {
+                "sessions": len(self._conversations),
+                "max_sessions": self.max_sessions,
+                "max_tokens": self.max_tokens,
+                "ttl": self.ttl,
+                "tokens": sum(c.tokens + c.summary_tokens for c in self._conversations.values()),
+            }
+            stats.update(self.counters)
+        return stats
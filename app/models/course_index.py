@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from ..config.db_connection import borrow, savepoint
+from ..config.db_notifications import subscribe
+from ..utils.metrics import Histogram, Stopwatch, register
+
+load_dotenv()
+
+# rank courses in process instead of querying course_embeddings, 0 falls back to the database
+COURSE_INDEX_IN_MEMORY = os.getenv("COURSE_INDEX_IN_MEMORY", "1") == "1"
+
+with open("./app/utils/assistant_queries.json", "r") as file:
+    queries = json.load(file)
+
+
+class CourseIndex:
+    """
+        In-memory copy of the course catalog embeddings for exact cosine ranking.
+
+        The embeddings are kept as one contiguous float32 matrix of unit rows next to an
+        array of course numbers and a course number -> description map. A search is one
+        matrix-vector product plus argpartition, without a database round trip.
+
+        The catalog is loaded once at startup (see warmup.start_warmup), requests that come
+        before it is ready wait for that load, and it is reloaded whenever the course_catalog
+        channel is notified (by triggers on courses and course_embeddings) or the
+        notification listener reconnects.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._subscribed = False
+        self.loaded_at = None
+        self.reloads = 0
+        self.search_ms = Histogram()
+
+    def _ensure_subscribed(self):
+        if not self._subscribed:
+            with self._lock:
+                if not self._subscribed:
+                    subscribe("course_catalog", self._on_change)
+                    self._subscribed = True
+
+    def _on_change(self, payload):
+        try:
+            self.reload()
+        except psycopg2.Error as e:
+            # keep serving the previous snapshot, the next notification or resync retries
+            print(f"[course index] reload failed: {e}")
+
+    def reload(self):
+        # reloads run one at a time so an older read can never replace a newer snapshot
+        with self._reload_lock:
+            with borrow() as conn:
+                # inside a request a failed load must not abort the request's transaction
+                with savepoint(conn, "course_index"):
+                    cursor = conn.cursor()
+                    try:
+                        cursor.execute(queries["course_index_query"])
+                        rows = cursor.fetchall()
+                    finally:
+                        cursor.close()
+
+            self._build(rows)
+
+    def _build(self, rows):
+        course_numbers = np.array([row[0] for row in rows], dtype=object)
+        descriptions = {row[0]: row[1] for row in rows}
+        matrix = np.ascontiguousarray(np.array([row[2] for row in rows], dtype=np.float32).reshape(len(rows), -1))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        # swapped in one assignment so searches always see a consistent snapshot
+        self._snapshot = (course_numbers, matrix, descriptions)
+        self.loaded_at = time.time()
+        self.reloads += 1
+
+    def ensure_loaded(self):
+        self._ensure_subscribed()
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.reload()
+
+    def search(self, query_embedding, k: int = 10):
+        """
+        Returns up to k (course_number, course_description) rows ordered by cosine distance,
+        the same rows curriculum_query returns.
+        """
+        self.ensure_loaded()
+        course_numbers, matrix, descriptions = self._snapshot
+        if not len(course_numbers):
+            return []
+
+        timer = Stopwatch()
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = matrix @ (query / norm if norm else query)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        self.search_ms.observe(timer.elapsed_ms())
+
+        return [(course_numbers[i], descriptions[course_numbers[i]]) for i in top]
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "enabled": COURSE_INDEX_IN_MEMORY,
+            "courses": len(snapshot[0]) if snapshot else 0,
+            "bytes": snapshot[1].nbytes if snapshot else 0,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "search_ms": self.search_ms.snapshot(),
+        }
+
+
+_index = CourseIndex()
+
+
+def get_course_index() -> CourseIndex:
+    return _index
+
+
+register("course_index", _index.stats)
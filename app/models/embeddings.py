@@ -0,0 +1,301 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from dotenv import load_dotenv
+
+from ..utils.metrics import Histogram, register
+from .quantization import EMBEDDING_BACKEND, load_embedding_model
+from ..config.embedding_storage import EMBEDDING_DIM
+
+load_dotenv()
+
+EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL", "google/embeddinggemma-300m")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+# micro-batching of single encode calls, a window of 0 disables it
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+
+# cache of query embeddings keyed by normalized text, ttl in seconds
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+
+
+class EmbeddingService:
+    """
+        Process-wide wrapper around the SentenceTransformer embedding model.
+
+        The model is loaded once, on first use, and shared by reviews, the assistant and
+        the database population scripts. Encoding calls are serialized with a lock so
+        concurrent requests never run the model at the same time.
+    """
+
+    def __init__(self, model_id: str = EMBEDDING_MODEL_ID, backend: str = EMBEDDING_BACKEND,
+                 dim: int = EMBEDDING_DIM,
+                 batch_window_ms: float = EMBEDDING_BATCH_WINDOW_MS, max_batch: int = EMBEDDING_MAX_BATCH):
+        self.model_id = model_id
+        self.backend = backend
+        self.dim = dim
+        self._model = None
+        self._load_lock = threading.Lock()
+        self.load_state = "not_loaded"
+        self._encode_lock = threading.Lock()
+        self.batcher = EmbeddingBatcher(self, batch_window_ms, max_batch) if batch_window_ms > 0 else None
+        self.query_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self.load_state = "loading"
+                    try:
+                        print(f"loading embedding model {self.model_id} ({self.backend})")
+                        self._model = load_embedding_model(self.model_id, self.backend)
+                    except Exception:
+                        self.load_state = "failed"
+                        raise
+                    self.load_state = "loaded"
+        return self._model
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def encode_query(self, text: str):
+        if self.batcher:
+            return self.batcher.encode("query", text)
+        return self.encode_queries([text])[0]
+
+    def encode_query_cached(self, text: str):
+        """
+        Same as encode_query but served from the query cache when the normalized text was
+        embedded recently. The returned vector is read-only since it is shared.
+        """
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = self.encode_query(text)
+            vector.setflags(write=False)
+            self.query_cache.put(text, vector)
+        return vector
+
+    def encode_document(self, text: str):
+        if self.batcher:
+            return self.batcher.encode("document", text)
+        return self.encode_documents([text])[0]
+
+    def truncate(self, vectors):
+        """
+        Keeps the first dim values of each embedding (Matryoshka truncation) and scales them
+        back to unit length, so cosine distances stay comparable.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[-1] <= self.dim:
+            return vectors
+        vectors = vectors[..., :self.dim]
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return np.ascontiguousarray(vectors / np.where(norms == 0, 1, norms))
+
+    def encode_queries(self, texts: list[str], batch_size: int = EMBEDDING_BATCH_SIZE):
+        model = self.model
+        with self._encode_lock:
+            vectors = model.encode_query(texts, batch_size=batch_size)
+        return self.truncate(vectors)
+
+    def encode_documents(self, texts: list[str], batch_size: int = EMBEDDING_BATCH_SIZE):
+        model = self.model
+        with self._encode_lock:
+            vectors = model.encode_document(texts, batch_size=batch_size)
+        return self.truncate(vectors)
+
+
+class QueryEmbeddingCache:
+    """
+        Bounded LRU cache of query embeddings with a time-to-live.
+
+        Keys are the query text lowercased with whitespace collapsed, so trivially different
+        spellings of the same question share one entry.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def get(self, text: str):
+        key = self.normalize(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, text: str, vector):
+        if self.max_size <= 0:
+            return
+
+        key = self.normalize(text)
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            }
+
+
+class _PendingEncode:
+    __slots__ = ("kind", "text", "future", "enqueued")
+
+    def __init__(self, kind, text):
+        self.kind = kind
+        self.text = text
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class EmbeddingBatcher:
+    """
+        Dynamic micro-batching for single-text encode calls.
+
+        Concurrent callers put their text on a queue and block on a future. A dispatcher
+        thread waits up to window_ms after the first queued text (or until max_batch texts
+        are waiting), runs one batched encode per kind (query/document) and hands each
+        caller its own vector.
+    """
+
+    def __init__(self, service: EmbeddingService, window_ms: float, max_batch: int):
+        self.service = service
+        self.window = window_ms / 1000
+        self.max_batch = max(max_batch, 1)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self.batch_size = Histogram(buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+        self.queue_delay_ms = Histogram()
+        self.encode_ms = Histogram()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, kind: str, text: str) -> Future:
+        self._ensure_started()
+        pending = _PendingEncode(kind, text)
+        self._queue.put(pending)
+        return pending.future
+
+    def encode(self, kind: str, text: str, timeout: float = None):
+        return self.submit(kind, text).result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].enqueued + self.window
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: list[_PendingEncode]):
+        started = time.monotonic()
+        for pending in batch:
+            self.queue_delay_ms.observe((started - pending.enqueued) * 1000)
+        self.batch_size.observe(len(batch))
+
+        for kind, encode in (("query", self.service.encode_queries), ("document", self.service.encode_documents)):
+            items = [pending for pending in batch if pending.kind == kind]
+            if not items:
+                continue
+
+            try:
+                vectors = encode([pending.text for pending in items])
+            except Exception as e:
+                for pending in items:
+                    pending.future.set_exception(e)
+                continue
+
+            for pending, vector in zip(items, vectors):
+                pending.future.set_result(vector)
+
+        self.encode_ms.observe((time.monotonic() - started) * 1000)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "queued": self._queue.qsize(),
+            "batch_size": self.batch_size.snapshot(),
+            "queue_delay_ms": self.queue_delay_ms.snapshot(),
+            "encode_ms": self.encode_ms.snapshot(),
+        }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
+
+
+def embedding_stats():
+    if _service is None:
+        return {"model_loaded": False}
+
+    stats = {"model_id": _service.model_id, "model_loaded": _service.is_loaded}
+    if _service.batcher:
+        stats["batching"] = _service.batcher.stats()
+    stats["query_cache"] = _service.query_cache.stats()
+    return stats
+
+
+register("embeddings", embedding_stats)
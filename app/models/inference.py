@@ -0,0 +1,163 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+
+from ..utils.metrics import Histogram, Stopwatch, register
+
+load_dotenv()
+
+# number of generations allowed to run on the model at the same time
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+# requests waiting for a worker beyond this are rejected right away
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+# seconds from submission until a request is abandoned, queue wait included
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "120"))
+
+
+class InferenceQueueFull(Exception):
+    """
+        Raised when a generation request arrives while the inference queue is full.
+    """
+
+
+class InferenceTimeout(Exception):
+    """
+        Raised when a generation request does not finish before its deadline.
+    """
+
+
+class _InferenceTask:
+    __slots__ = ("fn", "args", "kwargs", "deadline", "future", "enqueued")
+
+    def __init__(self, fn, args, kwargs, deadline):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class InferenceExecutor:
+    """
+        Runs LLM generation on dedicated worker threads fed by a bounded queue.
+
+        The number of workers caps how many generations share the model at once. Requests
+        that find the queue full fail immediately with InferenceQueueFull, and requests
+        still queued when their deadline passes are dropped without touching the model.
+        Queue wait and generation time are recorded separately.
+    """
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, queue_size: int = INFERENCE_QUEUE_SIZE,
+                 timeout: float = INFERENCE_TIMEOUT):
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max(queue_size, 1))
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.active = 0
+
+        self.counters = {"completed": 0, "failed": 0, "rejected": 0, "timed_out": 0, "expired_in_queue": 0}
+        self.queue_wait_ms = Histogram()
+        self.generation_ms = Histogram()
+
+    def _ensure_started(self):
+        if not self._threads:
+            with self._start_lock:
+                if not self._threads:
+                    for i in range(self.workers):
+                        thread = threading.Thread(target=self._run, name=f"inference-worker-{i}", daemon=True)
+                        thread.start()
+                        self._threads.append(thread)
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def deadline(self, timeout: float = None):
+        """
+        Absolute time.monotonic() deadline for a request submitted now, None when unbounded.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        return time.monotonic() + timeout if timeout and timeout > 0 else None
+
+    def submit(self, fn, *args, deadline: float = None, **kwargs) -> Future:
+        self._ensure_started()
+        task = _InferenceTask(fn, args, kwargs, deadline)
+        try:
+            self._queue.put_nowait(task)
+        except queue.Full:
+            self._count("rejected")
+            raise InferenceQueueFull(f"inference queue is full ({self._queue.maxsize} waiting)")
+        return task.future
+
+    def wait(self, future: Future, deadline: float = None):
+        """
+        Blocks for the result of a submitted request until deadline, cancelling it if it is still queued.
+        """
+        try:
+            return future.result(None if deadline is None else max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            self._count("timed_out")
+            raise InferenceTimeout("generation did not finish before its deadline")
+
+    def run(self, fn, *args, deadline: float = None, **kwargs):
+        return self.wait(self.submit(fn, *args, deadline=deadline, **kwargs), deadline)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+
+            if not task.future.set_running_or_notify_cancel():
+                continue
+
+            self.queue_wait_ms.observe((time.monotonic() - task.enqueued) * 1000)
+            if task.deadline is not None and time.monotonic() >= task.deadline:
+                self._count("expired_in_queue")
+                task.future.set_exception(InferenceTimeout("request expired while waiting for the model"))
+                continue
+
+            with self._lock:
+                self.active += 1
+            timer = Stopwatch()
+            try:
+                result = task.fn(*task.args, **task.kwargs)
+            except BaseException as e:
+                self._count("failed")
+                task.future.set_exception(e)
+            else:
+                self._count("completed")
+                task.future.set_result(result)
+            finally:
+                self.generation_ms.observe(timer.elapsed_ms())
+                with self._lock:
+                    self.active -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "workers": self.workers,
+                "active": self.active,
+                "queued": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "timeout": self.timeout,
+            }
+            stats.update(self.counters)
+        stats["queue_wait_ms"] = self.queue_wait_ms.snapshot()
+        stats["generation_ms"] = self.generation_ms.snapshot()
+        return stats
+
+
+_executor = InferenceExecutor()
+
+
+def get_inference_executor() -> InferenceExecutor:
+    return _executor
+
+
+register("inference", _executor.stats)
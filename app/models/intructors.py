@@ -1,59 +1,50 @@
 import psycopg2
-from ..utils.helper import validate_instructor
+from datetime import datetime
+from decimal import Decimal
 import json
 
 with open("./app/utils/instructor_queries.json") as json_file:
     queries = json.load(json_file)
 
+VOTE_NAMES = {1: 'upvote', -1: 'downvote'}
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value) if value else value
+
+
 class Instructor:
     """
         Model class to fetch relevant Instructor information from the database
     """
 
     @staticmethod
-    def get_average_rating(cursor, instructor_name):
-        instructor_first, instructor_last = validate_instructor(cursor, instructor_name)
+    def get_instructor_profile(cursor, instructor_name, username=None):
+        """
+        Everything the instructor page shows apart from the consensus summary, in one round trip:
+        first_name, last_name, departments, courses, avg_rating (None without reviews) and the
+        reviews, newest first, with their vote counts and the vote of username ('upvote',
+        'downvote' or None). Returns None when the instructor does not exist.
+        """
+        instructor_first = instructor_name.split(" ")[0]
+        instructor_last = instructor_name.split(" ")[-1]
 
-        avg_query = queries["avg_rating_query"]
         try:
-            cursor.execute(avg_query, (instructor_first, instructor_last))
+            cursor.execute(queries["instructor_profile_query"], (instructor_first, instructor_last, username))
+            row = cursor.fetchone()
+        except psycopg2.Error as e:
+            raise Exception(f"Error fetching instructor profile: {e}")
 
-            avg_rating = cursor.fetchall()[0][0]
-            if avg_rating:
-                return avg_rating
+        if row is None:
             return None
-        except psycopg2.ProgrammingError as e:
-            raise Exception(f"{e}")
-
-    @staticmethod
-    def get_courses_of_instructor(cursor, instructor_name):
-        instructor_first, instructor_last = validate_instructor(cursor, instructor_name)
-
-        courses_of_instructor_query = queries["instructor_courses_query"]
-
-        try:
-            cursor.execute(courses_of_instructor_query, (instructor_first, instructor_last))
-            rows = cursor.fetchall()
-            courses_of_instructor = [row[0] for row in rows]
-            return courses_of_instructor
-        except psycopg2.ProgrammingError as e:
-            raise Exception(f"{e}")
-
-    @staticmethod
-    def get_departments_of_instructor(cursor, instructor_name):
-
-        instructor_first, instructor_last = validate_instructor(cursor, instructor_name)
-
-        departments_of_instructor_query = queries["instructor_departments_query"]
-
-        try:
-            cursor.execute(departments_of_instructor_query, (instructor_first, instructor_last))
-            rows = cursor.fetchall()
-            departments_of_instructor = [row[0] for row in rows]
-            return departments_of_instructor
-        except psycopg2.ProgrammingError as e:
-            raise Exception(f"{e}")
 
+        # Decimal keeps the rounded average as the separate query returned it, e.g. 3.50
+        profile = json.loads(row[0], parse_float=Decimal)
+        for review in profile['reviews']:
+            review['post_time'] = _timestamp(review['post_time'])
+            review['last_updated'] = _timestamp(review['last_updated'])
+            review['user_vote'] = VOTE_NAMES.get(review['user_vote'])
+        return profile
 
     @staticmethod
     def get_all_comments_for_instructor(cursor, instructor_first, instructor_last):
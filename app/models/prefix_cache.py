@@ -0,0 +1,172 @@
+import copy
+import os
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from ..utils.metrics import Histogram, Stopwatch
+
+load_dotenv()
+
+# reuse the past key/values of the static prompt start, 0 generates through the plain pipeline
+PREFIX_CACHE = os.getenv("PREFIX_CACHE", "1") == "1"
+# distinct prefixes kept, one per intent and chat template date is plenty
+PREFIX_CACHE_SIZE = int(os.getenv("PREFIX_CACHE_SIZE", "16"))
+
+
+class PrefixCache:
+    """
+        Past key/values of the static start of assistant prompts, computed once and reused
+        by every generation that starts with the same text.
+
+        The static start is the chat template header and system prompt, followed, for a
+        conversation's first question, by the fixed preamble of the intent's prompt template
+        (its text before the first placeholder). A generation copies the cached key/values
+        and only prefills the retrieved context and the rest of the prompt.
+
+        Prefixes are keyed by their rendered text, so an edited prompt or a new date in the
+        chat template header starts a new entry; the least recently used ones are dropped
+        beyond max_size. Batched generation keeps using the pipeline, left padding puts the
+        padding in front of the prefix.
+
+        The prompt is always tokenized as a whole, like the pipeline does. Tokens can merge across
+        the end of the prefix, so the cached key/values are only used when the prefix's tokens
+        are the start of the prompt's; otherwise the whole prompt is prefilled and the miss
+        counted in boundary_misses.
+    """
+
+    def __init__(self, pipe, system_prompt: str, templates: dict, max_size: int = PREFIX_CACHE_SIZE):
+        self.pipe = pipe
+        # chat templates trim message contents
+        self.system_prompt = system_prompt.strip()
+        # longest first so the most specific preamble wins
+        self.preambles = sorted(
+            ((name, template.split("{", 1)[0].strip()) for name, template in templates.items()),
+            key=lambda item: -len(item[1]),
+        )
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _intent_stats(self, name):
+        if name not in self._stats:
+            self._stats[name] = {
+                "hits": 0,
+                "misses": 0,
+                "boundary_misses": 0,
+                "prefix_tokens": 0,
+                "prefill_ms": 0.0,
+                "copy_ms": Histogram(),
+                "generate_ms": Histogram(),
+            }
+        return self._stats[name]
+
+    def split(self, conversation):
+        """
+        Renders the conversation with the chat template and returns (name, prefix, rest),
+        where name is the intent whose preamble ends the prefix, or "system".
+        """
+        rendered = self.pipe.tokenizer.apply_chat_template(conversation, tokenize=False, add_generation_prompt=True)
+        end = rendered.find(self.system_prompt)
+        if not self.system_prompt or end < 0:
+            return None, "", rendered
+
+        name, end = "system", end + len(self.system_prompt)
+        # the intent preamble follows directly only without a summary or history
+        if len(conversation) == 2 and conversation[0]["content"].strip() == self.system_prompt:
+            question = conversation[1]["content"].strip()
+            start = rendered.find(question, end)
+            for intent, preamble in self.preambles:
+                if start >= 0 and preamble and question.startswith(preamble):
+                    name, end = intent, start + len(preamble)
+                    break
+
+        return name, rendered[:end], rendered[end:]
+
+    def _encode(self, text):
+        # the rendered template already holds the special tokens
+        return self.pipe.tokenizer(text, add_special_tokens=False, return_tensors="pt").input_ids
+
+    @staticmethod
+    def starts_with(input_ids, prefix_ids):
+        """
+        Whether the prompt's tokens start with the prefix's and leave at least one to prefill.
+        """
+        length = prefix_ids.shape[1]
+        return length < input_ids.shape[1] and bool((input_ids[:, :length] == prefix_ids).all())
+
+    def _lookup(self, name, prefix):
+        import torch
+        from transformers import DynamicCache
+
+        stats = self._intent_stats(name)
+        with self._lock:
+            entry = self._entries.get(prefix)
+            if entry is not None:
+                self._entries.move_to_end(prefix)
+                stats["hits"] += 1
+                return entry
+
+            timer = Stopwatch()
+            model = self.pipe.model
+            prefix_ids = self._encode(prefix).to(model.device)
+            cache = DynamicCache()
+            with torch.no_grad():
+                model(input_ids=prefix_ids, past_key_values=cache, use_cache=True)
+
+            entry = (prefix_ids, cache)
+            self._entries[prefix] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+            stats["misses"] += 1
+            stats["prefix_tokens"] = prefix_ids.shape[1]
+            stats["prefill_ms"] = round(timer.elapsed_ms(), 3)
+            return entry
+
+    def generate(self, conversation, reuse: bool = True, **generate_kwargs):
+        """
+        Generates like pipe(conversation, return_full_text=False, **generate_kwargs), from the
+        same prompt tokens. With reuse=False the whole prompt is prefilled, for comparison.
+        """
+        import torch
+
+        tokenizer, model = self.pipe.tokenizer, self.pipe.model
+        name, prefix, rest = self.split(conversation)
+        input_ids = self._encode(prefix + rest).to(model.device)
+
+        if reuse and prefix:
+            prefix_ids, cache = self._lookup(name, prefix)
+            if self.starts_with(input_ids, prefix_ids):
+                timer = Stopwatch()
+                # generation appends to the cache, every request works on its own copy
+                generate_kwargs["past_key_values"] = copy.deepcopy(cache)
+                self._intent_stats(name)["copy_ms"].observe(timer.elapsed_ms())
+            else:
+                self._intent_stats(name)["boundary_misses"] += 1
+
+        pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+        timer = Stopwatch()
+        with torch.no_grad():
+            output = model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                    pad_token_id=pad_token_id, **generate_kwargs)
+        if name is not None:
+            self._intent_stats(name)["generate_ms"].observe(timer.elapsed_ms())
+
+        text = tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+        return [{"generated_text": text}]
+
+    def stats(self):
+        intents = {}
+        for name, stats in list(self._stats.items()):
+            intents[name] = {
+                **{key: value for key, value in stats.items() if not isinstance(value, Histogram)},
+                # prefill time not spent again thanks to the cache, the copy is the price
+                "saved_ms": round(stats["hits"] * stats["prefill_ms"], 3),
+                "copy_ms": stats["copy_ms"].snapshot(),
+                "generate_ms": stats["generate_ms"].snapshot(),
+            }
+        return {"enabled": PREFIX_CACHE, "prefixes": len(self._entries), "intents": intents}
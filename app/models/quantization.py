@@ -0,0 +1,71 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "full" keeps the checkpoint's precision, "int8" quantizes the linear layers dynamically
+# (CPU only), "int4" quantizes the weights to 4 bits with torchao (CPU only)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "full").lower()
+# "full" or "int8" for the embedding model
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "full").lower()
+
+GENERATION_BACKENDS = ("full", "int8", "int4")
+EMBEDDING_BACKENDS = ("full", "int8")
+INT4_GROUP_SIZE = 128
+
+
+def quantize_int8(model):
+    """
+    Replaces every nn.Linear of a float32 model with a dynamically quantized int8 version, in
+    place. Weights are stored as int8 and activations are quantized on the fly, on CPU.
+    """
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def int4_config():
+    try:
+        from torchao.dtypes import Int4CPULayout
+        from torchao.quantization import Int4WeightOnlyConfig
+    except ImportError as e:
+        raise RuntimeError("INFERENCE_BACKEND=int4 needs torchao, install it with pip install torchao") from e
+    from transformers import TorchAoConfig
+
+    return TorchAoConfig(quant_type=Int4WeightOnlyConfig(group_size=INT4_GROUP_SIZE, layout=Int4CPULayout()))
+
+
+def load_generation_pipeline(model_id: str, backend: str = INFERENCE_BACKEND):
+    """
+    Text-generation pipeline for model_id with the weights in the given backend's precision.
+    """
+    from transformers import pipeline
+
+    if backend not in GENERATION_BACKENDS:
+        raise ValueError(f"unknown inference backend {backend}, expected one of {', '.join(GENERATION_BACKENDS)}")
+
+    if backend == "full":
+        return pipeline("text-generation", model=model_id, dtype="auto", device_map="auto")
+
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if backend == "int8":
+        # dynamic quantization starts from float32 weights
+        model = quantize_int8(AutoModelForCausalLM.from_pretrained(model_id, dtype=torch.float32))
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_id, dtype=torch.bfloat16, device_map="cpu",
+                                                     quantization_config=int4_config())
+
+    return pipeline("text-generation", model=model, tokenizer=AutoTokenizer.from_pretrained(model_id))
+
+
+def load_embedding_model(model_id: str, backend: str = EMBEDDING_BACKEND):
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"unknown embedding backend {backend}, expected one of {', '.join(EMBEDDING_BACKENDS)}")
+
+    if backend == "int8":
+        return quantize_int8(SentenceTransformer(model_id, device="cpu"))
+    return SentenceTransformer(model_id)
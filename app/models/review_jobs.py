@@ -0,0 +1,59 @@
+import json
+from ..utils.helper import execute_qry
+
+with open("./app/utils/job_queries.json", "r") as file:
+    queries = json.load(file)
+
+
+class ReviewJobs:
+    """
+        Model class for the "review_jobs" relation, the durable queue of background work
+        (embeddings, summary refreshes) created when reviews are submitted or edited.
+    """
+
+    @staticmethod
+    def enqueue_embedding(cursor, review_id):
+        cursor.execute(queries["enqueue_embedding_job"], (review_id,))
+
+    @staticmethod
+    def claim(cursor, stale_after):
+        cursor.execute(queries["claim_job_query"], (stale_after,))
+        return cursor.fetchone()
+
+    @staticmethod
+    def renew(cursor, job_ids, attempts):
+        """
+        Extends the lease of running jobs, given by id and the attempt they were claimed with, so
+        they are not taken for stale. Returns how many were still held.
+        """
+        cursor.execute(queries["renew_jobs_query"], (job_ids, attempts))
+        return cursor.rowcount
+
+    @staticmethod
+    def complete(cursor, job_id):
+        cursor.execute(queries["complete_job_query"], (job_id,))
+
+    @staticmethod
+    def retry(cursor, job_id, delay, error):
+        cursor.execute(queries["retry_job_query"], (delay, error, job_id))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def purge_done(cursor, older_than):
+        cursor.execute(queries["purge_done_jobs_query"], (older_than,))
+        return cursor.rowcount
+
+    @staticmethod
+    def queue_stats(cursor):
+        cursor.execute(queries["queue_stats_query"])
+        return cursor.fetchall()
+
+
+def enqueue_review_jobs(review_id, instructor_first, instructor_last):
+    """
+    Queues the embedding and summary refresh for a newly saved review. Inside a request this
+    commits together with the review row itself.
+    """
+    payload = json.dumps({"instructor_first": instructor_first, "instructor_last": instructor_last})
+    execute_qry(queries["enqueue_review_jobs"], (review_id, review_id, payload))
@@ -1,11 +1,12 @@
 import psycopg2
 from datetime import datetime
 from ..utils.helper import execute_qry
-from sentence_transformers import SentenceTransformer
+from .review_jobs import ReviewJobs
+from ..config.embedding_storage import with_embedding_type
 import json
 
 with open("./app/utils/review_queries.json", "r") as file:
-    queries = json.load(file)
+    queries = with_embedding_type(json.load(file))
 
 #---- review class ----#
 class Reviews:
@@ -24,8 +25,6 @@ class Reviews:
         self.post_time = datetime.now().isoformat()
         self.last_updated = datetime.now().isoformat()
         self.id = id
-        self.gemma_model = SentenceTransformer("google/embeddinggemma-300m")
-        self.embedding = self.gemma_model.encode_document(comment)
     
     def to_dict(self):
         """
@@ -43,56 +42,6 @@ class Reviews:
             'last_updated': self.last_updated
         }
 
-    @staticmethod
-    def get_reviews_for_instructor(cursor, instructor_first, instructor_last, user_id):
-
-        user_vote_check_query = queries["check_review_for_vote"]
-
-        try:
-            cursor.execute(user_vote_check_query, [instructor_first, instructor_last, user_id])
-            user_has_votes = cursor.fetchone() is not None
-        except psycopg2.Error as e:
-            raise Exception(f"Error checking user votes: {e}")
-
-        if user_has_votes:
-
-            main_query = queries["get_reviews_data_with_votes"]
-            params = [user_id, instructor_first, instructor_last]
-        else:
-
-            main_query = queries["get_reviews_data_without_votes"]
-            params = [instructor_first, instructor_last]
-
-        try:
-            cursor.execute(main_query, params)
-        except psycopg2.Error as e:
-            raise Exception(f"Error fetching reviews: {e}")
-
-        rows = cursor.fetchall()
-
-        result = []
-        for row in rows:
-
-            user_vote = None
-            if row[8] == 1:
-                user_vote = 'upvote'
-            elif row[8] == -1:
-                user_vote = 'downvote'
-
-            result.append({
-                'review_id': row[0],
-                'comment': row[1],
-                'rating': row[2],
-                'post_time': row[3],
-                'last_updated': row[4],
-                'course_number': row[5],
-                'upvotes': row[6] if row[6] else 0,
-                'downvotes': row[7] if row[7] else 0,
-                'user_vote': user_vote
-            })
-
-        return result
-
     @staticmethod
     def get_user_past_reviews(cursor, username):
         query = queries["user_past_reviews_query"]
@@ -112,28 +61,38 @@ class Reviews:
 
         update_review_query = queries["update_review_query"]
 
-        cursor.execute(update_review_query, (new_comment, new_rating, review_id, username))
+        # the instructor_stats rollup is adjusted by the same statement
+        cursor.execute(update_review_query, (review_id, username, new_comment, new_rating))
 
-        gemma_model = SentenceTransformer("google/embeddinggemma-300m")
+        # the new embedding is computed by the review workers once this transaction commits
+        ReviewJobs.enqueue_embedding(cursor, review_id)
 
-        new_embedding = gemma_model.encode_document(new_comment)
+    @staticmethod
+    def get_comment(cursor, review_id):
+        cursor.execute(queries["review_comment_query"], (review_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
 
-        update_embedding_query = queries["update_embedding_query"]
-        cursor.execute(update_embedding_query, (new_embedding.tolist(), review_id))
+    @staticmethod
+    def upsert_embedding(cursor, review_id, embedding):
+        cursor.execute(queries["upsert_embedding_query"], (review_id, embedding))
 
 
     @staticmethod
     def delete_review(cursor, username, review_id):
         delete_query = queries["delete_review_query"]
 
+        # also takes the review out of instructor_stats
         cursor.execute(delete_query, [review_id, username])
 
 
 #--- functions that insert and get review/review embeddings ----#
 def save_review(review:Reviews):
 
+    # inserts the review and adds it to instructor_stats in one statement
     sql_cmd = queries["insert_review_query"]
-    review_id = execute_qry(sql_cmd, (review.comment, review.rating, review.post_time, review.last_updated, review.course_num, review.instructor_first, review.instructor_last, review.username))
+    rows = execute_qry(sql_cmd, (review.comment, review.rating, review.post_time, review.last_updated, review.course_num, review.instructor_first, review.instructor_last, review.username))
+    review_id = rows[0][0] if rows else None
     print('insert success.')
     if review_id:
         review.id = review_id
@@ -141,11 +100,6 @@ def save_review(review:Reviews):
 
     return review
 
-def save_review_embedding(review_id : int, embedding):
-    q = queries["insert_embedding_query"]
-    execute_qry(q, (review_id, embedding.tolist()))
-    print('embedding insertion success.')
-
 def get_course_sections(instructor_first,instructor_last):
     cmd = queries["course_section_query"]
     results = execute_qry(cmd, (instructor_first, instructor_last))
@@ -0,0 +1,214 @@
+import json
+import threading
+
+import psycopg2
+
+from ..config.db_connection import borrow, savepoint
+from ..config.db_notifications import subscribe
+from ..utils.metrics import register
+
+with open("./app/utils/summary_queries.json", "r") as file:
+    queries = json.load(file)
+
+
+class SummaryStore:
+    """
+        Consensus summaries stored in the "instructor_summaries" relation, with an in-memory
+        read-through cache in front of it.
+
+        Every write bumps the row's version and a trigger NOTIFYs the instructor and the new
+        version. Each process then replaces its cached entry if it holds an older version, so
+        instructor pages are served from memory without touching the database.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._notified_versions = {}
+        self._lock = threading.Lock()
+        self._subscribed = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.reloads = 0
+
+    @staticmethod
+    def _record(row):
+        return {
+            "summary": row[0],
+            "last_timestamp": row[1],
+            "review_count": row[2],
+            "version": row[3],
+        }
+
+    def _ensure_subscribed(self):
+        if not self._subscribed:
+            with self._lock:
+                if not self._subscribed:
+                    subscribe("instructor_summaries", self._on_change)
+                    self._subscribed = True
+
+    def _store(self, key, record):
+        """
+        Caches record unless a newer version is already cached. Returns True when it was stored.
+        """
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and record is not None and cached["version"] >= record["version"]:
+                return False
+            if cached is not None and record is None:
+                return False
+            # a read that raced with a write must not cache what the notification already invalidated
+            notified = self._notified_versions.get(key, 0)
+            if (record["version"] if record else 0) < notified:
+                return False
+            self._cache[key] = record
+            return True
+
+    def _fetch(self, key):
+        with borrow() as conn:
+            cursor = conn.cursor()
+            try:
+                # inside a request this is the request's connection, a failed read must not abort its transaction
+                with savepoint(conn):
+                    cursor.execute(queries["get_summary_query"], key)
+                    row = cursor.fetchone()
+            finally:
+                cursor.close()
+        return self._record(row) if row else None
+
+    def _on_change(self, payload):
+        if payload is None:
+            self.reload()
+            return
+
+        change = json.loads(payload)
+        key = (change["first"], change["last"])
+        with self._lock:
+            self._notified_versions[key] = max(self._notified_versions.get(key, 0), change["version"])
+            cached = self._cache.get(key)
+            if cached is not None and cached["version"] >= change["version"]:
+                return
+            # drop the stale entry, the next page view reads the new summary through the cache
+            self._cache.pop(key, None)
+            self.invalidations += 1
+
+    def reload(self):
+        """
+        Brings the whole cache up to date with the table contents, used whenever change
+        notifications may have been missed. The snapshot is merged by version, so entries
+        saved or notified while it was read are not replaced by older ones.
+        """
+        with borrow() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(queries["all_summaries_query"])
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+
+        snapshot = {(row[0], row[1]): self._record(row[2:]) for row in rows}
+        with self._lock:
+            for key, record in snapshot.items():
+                cached = self._cache.get(key)
+                if cached is not None and cached["version"] >= record["version"]:
+                    continue
+                if record["version"] < self._notified_versions.get(key, 0):
+                    # a newer write was notified meanwhile, the next read fetches it
+                    self._cache.pop(key, None)
+                else:
+                    self._cache[key] = record
+            self.reloads += 1
+
+    def get_record(self, instructor_first, instructor_last):
+        self._ensure_subscribed()
+        key = (instructor_first, instructor_last)
+
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        try:
+            record = self._fetch(key)
+        except psycopg2.Error as e:
+            print(f"Error fetching summary for {instructor_first} {instructor_last}: {e}")
+            return None
+
+        # instructors without a summary are cached as None until a write for them is notified
+        self._store(key, record)
+        return record
+
+    def get_summary(self, instructor_first, instructor_last):
+        record = self.get_record(instructor_first, instructor_last)
+        return record["summary"] if record else None
+
+    def save(self, cursor, instructor_first, instructor_last, summary, last_timestamp=None):
+        """
+        Writes the summary and returns its record. It is not cached yet, pass the record to
+        saved() once the transaction is committed.
+        """
+        cursor.execute(queries["upsert_summary_query"], (instructor_first, instructor_last, summary, last_timestamp,
+                                                        instructor_first, instructor_last))
+        row = cursor.fetchone()
+        return {"summary": summary, "last_timestamp": row[0], "review_count": row[1], "version": row[2]}
+
+    def saved(self, instructor_first, instructor_last, record):
+        # the notification only arrives after commit, the writing process sees its own write right away
+        self._store((instructor_first, instructor_last), record)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cached": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "invalidations": self.invalidations,
+                "reloads": self.reloads,
+            }
+
+
+_store = SummaryStore()
+
+
+def get_summary_store() -> SummaryStore:
+    return _store
+
+
+register("summaries", _store.stats)
+
+
+def import_summary_file(path):
+    """
+    Loads summaries from the legacy summary_cache.json format into instructor_summaries.
+    """
+    with open(path, "r") as file:
+        data = json.load(file)["data"]
+
+    with borrow() as conn:
+        cursor = conn.cursor()
+        try:
+            records = [(entry["first"], entry["last"],
+                        _store.save(cursor, entry["first"], entry["last"], entry["summary"], entry["last_timestamp"]))
+                       for entry in data.values()]
+            conn.commit()
+        finally:
+            cursor.close()
+
+    for instructor_first, instructor_last, record in records:
+        _store.saved(instructor_first, instructor_last, record)
+
+    print(f"Imported {len(data)} summaries from {path}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage stored consensus summaries")
+    parser.add_argument("--import-file", default="./app/utils/summary_cache.json",
+                        help="summary_cache.json style file to import")
+    args = parser.parse_args()
+
+    import_summary_file(args.import_file)
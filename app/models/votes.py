@@ -5,38 +5,20 @@ with open("./app/utils/vote_queries.json", "r") as file:
 
 class Votes:
     """
-        Model class to handle CRUD operations on the "votes" relation.
-    """
-
-    @staticmethod
-    def create_vote(cursor, review_id, username, vote_type):
-        insert_query = queries["insert_vote_query"]
-        cursor.execute(insert_query, [review_id, username, vote_type])
+        Model class to handle votes on the "votes" relation.
 
-    @staticmethod
-    def count_votes(cursor, review_id):
-        count_query = queries["count_votes_query"]
-        cursor.execute(count_query, [review_id, review_id])
-        return cursor.fetchone()
-
-    @staticmethod
-    def update_vote_id(cursor):
-        cursor.execute(queries["update_voteid_query"])
+        Every change also adjusts the upvotes/downvotes counters of the review in the same
+        statement, so counts are read from the review row instead of counting votes.
+    """
 
     @staticmethod
-    def check_vote(cursor, username, review_id):
-        check_query = queries["check_vote_query"]
-        cursor.execute(check_query, [review_id, username])
+    def toggle_vote(cursor, review_id, username, vote_type):
+        """
+        Adds the user's vote, changes it to vote_type, or removes it when it already is vote_type,
+        and adjusts the review's counters, all in one statement. The unique (review_id, username)
+        index makes concurrent clicks of the same user resolve to a single vote. Returns
+        (action, upvotes, downvotes) with action one of 'added', 'changed', 'removed' or
+        'unchanged' (a concurrent click already cast the same vote).
+        """
+        cursor.execute(queries["toggle_vote_query"], [review_id, username, vote_type])
         return cursor.fetchone()
-
-
-    @staticmethod
-    def edit_vote(cursor, existing_vote_id, vote_type):
-        update_query = queries["update_vote_query"]
-        cursor.execute(update_query, [vote_type, existing_vote_id])
-
-
-    @staticmethod
-    def delete_vote(cursor, existing_vote_id):
-        delete_query = queries["delete_vote_query"]
-        cursor.execute(delete_query, [existing_vote_id])
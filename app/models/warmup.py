@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+from .course_index import get_course_index, COURSE_INDEX_IN_MEMORY
+
+load_dotenv()
+
+# load the models in the background right after startup instead of on the first assistant request
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "0") == "1"
+
+_warmup = {"state": "disabled", "seconds": None, "error": None}
+_warmup_lock = threading.Lock()
+
+
+def _run_warmup():
+    from .embeddings import get_embedding_service
+    from .assistant import get_assistant_roles
+
+    started = time.monotonic()
+    try:
+        if COURSE_INDEX_IN_MEMORY:
+            get_course_index().ensure_loaded()
+        get_embedding_service().model
+        get_assistant_roles().pipe
+    except Exception as e:
+        print(f"[warmup] model warm-up failed: {e}")
+        _warmup.update(state="failed", error=str(e))
+        return
+
+    _warmup.update(state="done", seconds=round(time.monotonic() - started, 3))
+    print(f"[warmup] models loaded in {_warmup['seconds']}s")
+
+
+def _load_course_index():
+    try:
+        get_course_index().ensure_loaded()
+    except psycopg2.Error as e:
+        print(f"[warmup] course index load failed, retrying on first use: {e}")
+
+
+def start_warmup():
+    """
+    Starts loading the course index on a background thread, together with the embedding and
+    text-generation models when WARMUP_MODELS=1. The web server keeps serving pages while they
+    load.
+    """
+    if not WARMUP_MODELS:
+        if COURSE_INDEX_IN_MEMORY:
+            threading.Thread(target=_load_course_index, name="course-index-load", daemon=True).start()
+        return
+
+    with _warmup_lock:
+        if _warmup["state"] != "disabled":
+            return
+        _warmup["state"] = "running"
+
+    threading.Thread(target=_run_warmup, name="model-warmup", daemon=True).start()
+
+
+def model_status():
+    """
+    Load state of each model ("not_loaded", "loading", "loaded" or "failed") and of the
+    warm-up. The process counts as ready unless a warm-up is still running or has failed;
+    without warm-up the models load on first use.
+    """
+    from .embeddings import get_embedding_service
+    from .assistant import get_assistant_roles
+
+    status = {
+        "embedding": get_embedding_service().load_state,
+        "llm": get_assistant_roles().load_state,
+        "backends": {"embedding": get_embedding_service().backend, "llm": get_assistant_roles().backend},
+        "warmup": dict(_warmup),
+    }
+    status["ready"] = _warmup["state"] in ("disabled", "done")
+    return status
@@ -1,10 +1,16 @@
+import hmac
+import os
+
 from ..controllers import vote_controller, review_controller, assistant_controller, index_controller
 from ..utils.helper import login_required, execute_qry
-from flask import (g, session)
+from flask import (g, session, jsonify, request, abort)
 
 
 from .. import app
-from app.config.db_connection import connect
+from app.config.db_connection import get_db
+from ..utils import metrics
+from ..utils.review_pipeline import start_review_workers
+from ..models.warmup import model_status
 
 
 
@@ -13,6 +19,11 @@ from app.config.db_connection import connect
 def index():
     return index_controller.index()
 
+#--- In-process review workers, started with the first request when REVIEW_WORKERS > 0 ----#
+@app.before_request
+def ensure_review_workers():
+    start_review_workers()
+
 #--- Check if user is logged in ----#
 @app.before_request
 def load_logged_in_user():
@@ -34,7 +45,7 @@ def get_assistant():
 @app.route('/assistant/chat', methods=['POST'])
 @login_required
 def assistant_chat():
-    conn = connect()
+    conn = get_db()
     return assistant_controller.answer_question(conn)
 
 
@@ -46,7 +57,7 @@ def instructor_review(instructor_name):
     Endpoint for getting reviews for a given instructor
 
     """
-    conn = connect()
+    conn = get_db()
     return review_controller.get_reviews_for_instructor(conn, instructor_name)
 
 @app.route("/reviews/<int:review_id>/vote", methods=["POST"])
@@ -56,7 +67,7 @@ def handle_votes(review_id):
         Endpoint for creating/updating/deleting a vote on a review
 
     """
-    conn = connect()
+    conn = get_db()
     return vote_controller.handle_votes(conn, review_id)
 
 
@@ -67,7 +78,7 @@ def get_user_reviews():
     """
         Endpoint for getting reviews for a given user
     """
-    conn = connect()
+    conn = get_db()
     return review_controller.get_user_reviews(conn)
 
 @app.route("/user_reviews/<int:review_id>/edit", methods=["PATCH", "PUT"])
@@ -77,7 +88,7 @@ def edit_reviews(review_id):
         Endpoint for editing a past review for a given review_id
 
     """
-    conn = connect()
+    conn = get_db()
     return review_controller.edit_review(review_id, conn)
 
 @app.route("/user_reviews/<int:review_id>/delete", methods=["DELETE"])
@@ -87,7 +98,7 @@ def delete_reviews(review_id):
         Endpoint for editing a past review for a given review_id
 
     """
-    conn = connect()
+    conn = get_db()
     return review_controller.delete_review(review_id, conn)
 
 
@@ -126,3 +137,26 @@ def search():
     """
     return index_controller.search()
 
+#---- runtime stats ----#
+# /metrics is only served when a token is configured, and only to requests that send it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+@app.route('/metrics')
+def get_metrics():
+    """
+        Endpoint exposing runtime stats (connection pool occupancy, wait times, ...),
+        requires "Authorization: Bearer <METRICS_TOKEN>"
+    """
+    if not METRICS_TOKEN:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        abort(401)
+    return jsonify(metrics.collect())
+
+@app.route('/ready')
+def get_ready():
+    """
+        Readiness probe reporting model load state, 503 while a model warm-up is still running
+    """
+    status = model_status()
+    return jsonify(status), 200 if status["ready"] else 503
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+from ..config.db_connection import borrow, PoolTimeout
+from ..models.assistant import get_assistant_roles, SUMMARY_BATCH_SIZE
+from ..models.summaries import get_summary_store
+from .helper import check_for_summary
+
+DEFAULT_CHECKPOINT = "./summary_checkpoint.json"
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, "r") as file:
+        return {tuple(key) for key in json.load(file)["completed"]}
+
+
+def save_checkpoint(path, completed):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump({"completed": sorted(completed)}, file)
+    os.replace(tmp_path, path)
+
+
+def is_stale(instructor_first, instructor_last):
+    record = get_summary_store().get_record(instructor_first, instructor_last)
+    if record is None:
+        return True
+    try:
+        return bool(check_for_summary(instructor_first, instructor_last, record["last_timestamp"].isoformat()))
+    except psycopg2.Error:
+        # a failed check counts as stale, the summary is regenerated rather than left out of date
+        return True
+
+
+def regenerate_summaries(batch_size=SUMMARY_BATCH_SIZE, only_stale=False, checkpoint=DEFAULT_CHECKPOINT):
+    """
+    Regenerates consensus summaries for every instructor in padded generation batches.
+
+    All comments are prefetched with one query. Each finished batch is saved to
+    instructor_summaries and recorded in the checkpoint file, so an interrupted run
+    picks up where it stopped. The checkpoint is removed once every instructor is done.
+    """
+    assistant = get_assistant_roles()
+    store = get_summary_store()
+
+    with borrow() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(assistant.assistant_queries["all_instructors_query"])
+            instructors = cursor.fetchall()
+            comments = assistant.get_comments_for_all_instructors(cursor)
+        finally:
+            cursor.close()
+
+    completed = load_checkpoint(checkpoint)
+    todo = [row for row in instructors if (row[0], row[1]) not in completed]
+    if completed:
+        print(f"Resuming from {checkpoint}: {len(completed)} instructors already done")
+
+    if only_stale:
+        todo = [row for row in todo if is_stale(row[0], row[1])]
+
+    print(f"Regenerating summaries for {len(todo)} of {len(instructors)} instructors, batch size {batch_size}")
+
+    started = time.monotonic()
+    done = 0
+    for start in range(0, len(todo), batch_size):
+        batch = todo[start:start + batch_size]
+        results = assistant.generate_summaries_batch(batch, comments, batch_size)
+
+        with borrow() as conn:
+            cursor = conn.cursor()
+            try:
+                records = [store.save(cursor, result["first"], result["last"], result["summary"]) for result in results]
+                conn.commit()
+            finally:
+                cursor.close()
+        for result, record in zip(results, records):
+            store.saved(result["first"], result["last"], record)
+
+        completed.update((result["first"], result["last"]) for result in results)
+        save_checkpoint(checkpoint, completed)
+
+        done += len(batch)
+        elapsed = time.monotonic() - started
+        print(f"{done}/{len(todo)} instructors, {done / elapsed * 60:.1f} instructors/min")
+
+    elapsed = time.monotonic() - started
+    throughput = done / elapsed * 60 if elapsed else 0.0
+    print(f"Regenerated {done} summaries in {elapsed:.1f}s ({throughput:.1f} instructors/min)")
+
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    return {"instructors": done, "seconds": round(elapsed, 3), "instructors_per_minute": round(throughput, 2)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate consensus summaries for all instructors")
+    parser.add_argument("--batch-size", type=int, default=SUMMARY_BATCH_SIZE)
+    parser.add_argument("--only-stale", action="store_true",
+                        help="only instructors without a summary or with enough new reviews (check_for_summary)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT,
+                        help="file recording finished instructors so an interrupted run can resume")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    try:
+        regenerate_summaries(args.batch_size, args.only_stale, args.checkpoint)
+    except (psycopg2.OperationalError, PoolTimeout) as e:
+        # finished batches are in the checkpoint, running the same command again resumes from it
+        sys.exit(f"Could not reach the database, check DB_HOST and DB_PORT and run again to resume: {e}")
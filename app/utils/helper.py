@@ -1,11 +1,11 @@
+import asyncio
 import json
-import os
 from functools import wraps
 from flask import jsonify, session
 import psycopg2
 from ..config import db_connection
+from ..models.summaries import get_summary_store
 import re
-from datetime import datetime, timezone
 
 with open("./app/utils/helper_queries.json", "r") as file:
     queries = json.load(file)
@@ -23,35 +23,50 @@ def execute_qry(sql_cmd, params):
     """
     This method is a helper function that helps execute a sql command with indicated parameters. 
     Can be used for insert, read, update, and delete assistant_queries
+
+    Inside a request the command runs on the request-scoped connection and is committed together
+    with the rest of the request before the response is sent; a failing command raises and fails
+    the request's unit of work. Outside a request it is committed right away, and a failing
+    command returns None.
     """
-    conn = db_connection.connect()
+    request_scoped = db_connection.in_request_scope()
+    conn = db_connection.get_db() if request_scoped else db_connection.connect()
     cur = conn.cursor()
+
+    def commit(message):
+        if not request_scoped:
+            conn.commit()
+            print(message)
+
     try:
         cur.execute(sql_cmd, params)
         if sql_cmd.strip().upper().startswith(("INSERT")):
             if "RETURNING" in sql_cmd.upper():
                 result = cur.fetchone()
-                conn.commit()
-                print("Insertion committed to the database.")
+                commit("Insertion committed to the database.")
                 return result[0] if result else None
             else:
-                conn.commit()
-                print("Insertion committed to the database.")
+                commit("Insertion committed to the database.")
                 return None
         elif sql_cmd.strip().upper().startswith(("UPDATE", "DELETE")):
-            conn.commit()
-            print("Changes committed to the database.")
+            commit("Changes committed to the database.")
             return cur.rowcount if cur.rowcount else None
         else:
                 result = cur.fetchall()
+                if sql_cmd.strip().upper().startswith("WITH"):
+                    # WITH statements can modify data too, e.g. insert_review_query
+                    commit("Changes committed to the database.")
                 return result
     except psycopg2.Error as e:
-        conn.rollback()
         print(f"failed to query: {e}")
+        if request_scoped:
+            raise
+        conn.rollback()
         return None
     finally: 
         cur.close()
-        conn.close()
+        if not request_scoped:
+            conn.close()
 
 def validate_instructor(cursor, instructor_name):
 
@@ -68,62 +83,57 @@ def validate_instructor(cursor, instructor_name):
 
 
 def check_for_summary(instructor_first, instructor_last, last_timestamp):
+    """
+    Whether enough new reviews came in since last_timestamp to regenerate the summary.
+    Database errors are raised, callers must not take a failed check for an up to date summary.
+    """
+    with db_connection.borrow() as conn:
+        cursor = conn.cursor()
+        try:
+            # inside a request this shares the request's connection, a failure must not abort its transaction
+            with db_connection.savepoint(conn):
+                cursor.execute(queries["check_summary_query"], [instructor_first, instructor_last, last_timestamp])
 
-    conn = db_connection.connect()
-    cursor = conn.cursor()
-    try:
-
-
-        cursor.execute(queries["check_summary_query"], [instructor_first, instructor_last, last_timestamp])
-
-        return cursor.fetchone()[0]
-    except psycopg2.Error as e:
-        print(f"Error while calling summary procedure: {e}")
-        cursor.close()
-        conn.close()
+                return cursor.fetchone()[0]
+        except psycopg2.Error as e:
+            print(f"Error while calling summary procedure: {e}")
+            raise
+        finally:
+            cursor.close()
 
 
 def get_consensus_summary(instructor_first, instructor_last):
-    BASE_DIR  = os.path.dirname(os.path.abspath(__file__))
-    CACHE_FILE = os.path.join(BASE_DIR, 'summary_cache.json')
-
-    with open(CACHE_FILE, "r") as file:
-        summary_cache = json.load(file)
-
-    key = f"{instructor_first}_{instructor_last}"
-    instructor_data = summary_cache["data"].get(key)
-    if instructor_data:
-        return instructor_data["summary"]
-    return None
+    return get_summary_store().get_summary(instructor_first, instructor_last)
 
 
 def update_summary_cache(instructor_first, instructor_last):
+    """
+    Regenerates the consensus summary when enough new reviews came in since the last one
+    (or when the instructor has none yet) and stores it in instructor_summaries.
+    Runs in the review workers, errors are raised so the job gets retried.
+    """
+    from ..models.assistant import get_assistant_roles
 
-    from ..models.assistant import AssistantRoles
-    try:
+    store = get_summary_store()
+    instructor_data = store.get_record(instructor_first, instructor_last)
 
-        deepseek = AssistantRoles()
-        with open("./app/utils/summary_cache.json", "r") as file:
-            summary_cache = json.load(file)
-
-        key = f"{instructor_first}_{instructor_last}"
-        instructor_data =  summary_cache["data"].get(key)
-        if instructor_data:
-            if(check_for_summary(instructor_first, instructor_last, instructor_data["last_timestamp"])):
-                summary = deepseek.generate_consensus_summary(instructor_first, instructor_last)
-                instructor_data["summary"] = summary
-                print("Updated summary cache for instructor", instructor_first, instructor_last)
-                instructor_data["last_timestamp"] = datetime.now(timezone.utc).isoformat()
-            else:
-                print(
-                    f'Condition to update summary cache not satisfied for instructor {instructor_first, instructor_last}')
+    if instructor_data and not check_for_summary(instructor_first, instructor_last,
+                                                 instructor_data["last_timestamp"].isoformat()):
+        print(
+            f'Condition to update summary cache not satisfied for instructor {instructor_first, instructor_last}')
+        return
 
-        else:
-            print("Instructor does not exist", instructor_first,
-                  instructor_last)
+    summary = asyncio.run(get_assistant_roles().generate_consensus_summary(instructor_first, instructor_last))
 
-    except Exception as e:
-        print(f"error updating summary for {instructor_first} {instructor_last}: {e}")
+    with db_connection.borrow() as conn:
+        cursor = conn.cursor()
+        try:
+            record = store.save(cursor, instructor_first, instructor_last, summary)
+            conn.commit()
+        finally:
+            cursor.close()
+    store.saved(instructor_first, instructor_last, record)
+    print("Updated summary cache for instructor", instructor_first, instructor_last)
 
 
 
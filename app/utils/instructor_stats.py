@@ -0,0 +1,62 @@
+import argparse
+import json
+import time
+import traceback
+
+from ..config.db_connection import borrow
+
+with open("./app/utils/instructor_queries.json", "r") as file:
+    queries = json.load(file)
+
+
+def reconcile_instructor_stats(dry_run=False):
+    """
+    Recomputes the instructor_stats rollup from the review table and repairs every row that
+    drifted from it, e.g. after reviews were loaded by PopulateDB or changed by hand.
+
+    The review table is locked in SHARE mode for the duration, so reviews written while the
+    rollup is recomputed cannot be counted twice or lost; reads are not blocked. Returns the
+    (instructor_first, instructor_last, review_count) rows that were repaired, rolled back
+    instead when dry_run is set.
+    """
+    with borrow() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(queries["lock_reviews_query"])
+            cursor.execute(queries["reconcile_instructor_stats_query"])
+            repaired = cursor.fetchall()
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    for instructor_first, instructor_last, review_count in repaired:
+        print(f"[instructor_stats] {'drifted' if dry_run else 'repaired'}: {instructor_first} {instructor_last} "
+              f"({review_count} reviews)")
+    print(f"[instructor_stats] {len(repaired)} row(s) {'out of date' if dry_run else 'repaired'}")
+    return repaired
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repair the instructor_stats rollup from the review table")
+    parser.add_argument("--dry-run", action="store_true", help="only report the rows that drifted")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="keep running and reconcile every this many seconds")
+    args = parser.parse_args()
+
+    if args.interval <= 0:
+        reconcile_instructor_stats(args.dry_run)
+    else:
+        while True:
+            # a failed run, e.g. while the database restarts, is retried at the next interval
+            try:
+                reconcile_instructor_stats(args.dry_run)
+            except Exception as e:
+                print(f"[instructor_stats] reconciliation failed: {e}")
+                traceback.print_exc()
+            time.sleep(args.interval)
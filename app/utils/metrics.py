@@ -0,0 +1,85 @@
+import bisect
+import threading
+import time
+
+
+# default bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_collectors = {}
+_collectors_lock = threading.Lock()
+
+
+class Histogram:
+    """
+        Thread-safe fixed-bucket histogram used to report latency and size distributions.
+
+        Each bucket counts observations that are <= its upper bound, observations above the
+        last bound land in the "+Inf" bucket.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            count, total, maximum = self._count, self._sum, self._max
+
+        buckets = {str(bound): counts[i] for i, bound in enumerate(self.buckets)}
+        buckets["+Inf"] = counts[-1]
+        return {
+            "count": count,
+            "sum": round(total, 3),
+            "avg": round(total / count, 3) if count else 0,
+            "max": round(maximum, 3),
+            "buckets": buckets,
+        }
+
+
+class Stopwatch:
+    """
+        Small helper to time a block in milliseconds.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+def register(name, collector):
+    """
+    Registers a zero-argument callable that returns a JSON serializable dict of stats.
+    The collected values are served together by the /metrics endpoint.
+    """
+    with _collectors_lock:
+        _collectors[name] = collector
+
+
+def collect():
+    with _collectors_lock:
+        collectors = dict(_collectors)
+
+    results = {}
+    for name, collector in collectors.items():
+        try:
+            results[name] = collector()
+        except Exception as e:
+            results[name] = {"error": str(e)}
+    return results
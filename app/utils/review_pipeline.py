@@ -0,0 +1,283 @@
+import os
+import threading
+import time
+import traceback
+
+import psycopg2
+from dotenv import load_dotenv
+
+from ..config.db_connection import borrow
+from ..models.review_jobs import ReviewJobs
+from .metrics import Histogram, Stopwatch, register
+
+load_dotenv()
+
+# workers started inside the web process, off by default: run python -m app.utils.review_pipeline instead
+REVIEW_WORKERS = int(os.getenv("REVIEW_WORKERS", "0"))
+# seconds
+REVIEW_JOB_POLL_INTERVAL = float(os.getenv("REVIEW_JOB_POLL_INTERVAL", "2"))
+REVIEW_JOB_STALE_AFTER = float(os.getenv("REVIEW_JOB_STALE_AFTER", "300"))
+REVIEW_JOB_RETRY_DELAY = float(os.getenv("REVIEW_JOB_RETRY_DELAY", "10"))
+REVIEW_JOB_KEEP_DONE = float(os.getenv("REVIEW_JOB_KEEP_DONE", "86400"))
+
+
+def embed_review(job):
+    """
+    Computes the embedding of the review's current comment and stores it. The comment is read
+    when the job runs so that a job queued by an edit always embeds the latest text.
+    """
+    from ..models.reviews import Reviews
+    from ..models.embeddings import get_embedding_service
+
+    with borrow() as conn:
+        cursor = conn.cursor()
+        comment = Reviews.get_comment(cursor, job["review_id"])
+        cursor.close()
+
+    if comment is None:
+        print(f"review {job['review_id']} no longer exists, skipping embedding")
+        return
+
+    embedding = get_embedding_service().encode_document(comment)
+
+    with borrow() as conn:
+        cursor = conn.cursor()
+        try:
+            Reviews.upsert_embedding(cursor, job["review_id"], embedding)
+            conn.commit()
+        finally:
+            cursor.close()
+
+
+def refresh_summary(job):
+    from .helper import update_summary_cache
+
+    update_summary_cache(job["payload"]["instructor_first"], job["payload"]["instructor_last"])
+
+
+JOB_HANDLERS = {
+    "embed_review": embed_review,
+    "refresh_summary": refresh_summary,
+}
+
+
+class ReviewWorkerPool:
+    """
+        Background workers that drain the review_jobs table.
+
+        Jobs are claimed with FOR UPDATE SKIP LOCKED so any number of workers, in any number
+        of processes, can share the queue. Failed jobs are retried with exponential backoff
+        until max_attempts, and jobs left "running" by a crashed worker are picked up again
+        once they are older than stale_after seconds. A heartbeat renews the lease of the jobs
+        this pool is running every stale_after / 3 seconds, so a long job, e.g. a summary
+        generation, is not taken for stale and run twice.
+    """
+
+    def __init__(self, workers=REVIEW_WORKERS, poll_interval=REVIEW_JOB_POLL_INTERVAL,
+                 stale_after=REVIEW_JOB_STALE_AFTER, retry_delay=REVIEW_JOB_RETRY_DELAY):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.retry_delay = retry_delay
+
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        # job_id -> attempt it was claimed with, for the heartbeat
+        self._running = {}
+
+        self.counters = {"completed": 0, "retried": 0, "failed": 0}
+        self.job_ms = Histogram()
+
+    def start(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"review-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="review-worker-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"started {self.workers} review workers")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"[review worker] could not claim job: {e}")
+                job = None
+
+            if job is None:
+                self._purge_done()
+                self._stop.wait(self.poll_interval)
+                continue
+
+            self._process(job)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.stale_after / 3):
+            with self._lock:
+                running = dict(self._running)
+            if not running:
+                continue
+
+            try:
+                with borrow() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        held = ReviewJobs.renew(cursor, list(running), list(running.values()))
+                        conn.commit()
+                    finally:
+                        cursor.close()
+            except Exception as e:
+                print(f"[review worker] could not renew running jobs: {e}")
+                continue
+
+            if held < len(running):
+                print(f"[review worker] {len(running) - held} running job(s) were taken over by another worker")
+
+    def _claim(self):
+        with borrow() as conn:
+            cursor = conn.cursor()
+            try:
+                row = ReviewJobs.claim(cursor, self.stale_after)
+                conn.commit()
+            finally:
+                cursor.close()
+
+        if row is None:
+            return None
+
+        return {
+            "job_id": row[0],
+            "job_type": row[1],
+            "review_id": row[2],
+            "payload": row[3] or {},
+            "attempts": row[4],
+            "max_attempts": row[5],
+        }
+
+    def _process(self, job):
+        timer = Stopwatch()
+        with self._lock:
+            self._running[job["job_id"]] = job["attempts"]
+        try:
+            handler = JOB_HANDLERS.get(job["job_type"])
+            if handler is None:
+                raise ValueError(f"unknown job type {job['job_type']}")
+            handler(job)
+        except Exception as e:
+            traceback.print_exc()
+            self._retry(job, e)
+            return
+        finally:
+            with self._lock:
+                self._running.pop(job["job_id"], None)
+            self.job_ms.observe(timer.elapsed_ms())
+
+        with borrow() as conn:
+            cursor = conn.cursor()
+            try:
+                ReviewJobs.complete(cursor, job["job_id"])
+                conn.commit()
+            finally:
+                cursor.close()
+
+        with self._lock:
+            self.counters["completed"] += 1
+
+    def _retry(self, job, error):
+        delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+
+        with borrow() as conn:
+            cursor = conn.cursor()
+            try:
+                status = ReviewJobs.retry(cursor, job["job_id"], delay, str(error))
+                conn.commit()
+            finally:
+                cursor.close()
+
+        with self._lock:
+            self.counters["failed" if status == "failed" else "retried"] += 1
+        print(f"[review worker] job {job['job_id']} ({job['job_type']}) failed on attempt "
+              f"{job['attempts']}/{job['max_attempts']}: {error}")
+
+    def _purge_done(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge < 3600:
+                return
+            self._last_purge = now
+
+        try:
+            with borrow() as conn:
+                cursor = conn.cursor()
+                ReviewJobs.purge_done(cursor, REVIEW_JOB_KEEP_DONE)
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            print(f"[review worker] could not purge finished jobs: {e}")
+
+    def stats(self):
+        stats = {"workers": self.workers if self._threads else 0, "running": len(self._running)}
+        with self._lock:
+            stats.update(self.counters)
+        stats["job_ms"] = self.job_ms.snapshot()
+        return stats
+
+
+_pool = ReviewWorkerPool()
+
+
+def start_review_workers():
+    if REVIEW_WORKERS > 0:
+        _pool.start()
+
+
+def review_queue_stats():
+    """
+    Queue depth and lag (age of the oldest job, in seconds) per status, plus this process's worker counters.
+    """
+    stats = {"process": _pool.stats()}
+    with borrow() as conn:
+        cursor = conn.cursor()
+        try:
+            for status, depth, lag in ReviewJobs.queue_stats(cursor):
+                stats[status] = {"depth": depth, "lag_seconds": round(float(lag or 0), 3)}
+        except psycopg2.Error as e:
+            conn.rollback()
+            stats["error"] = str(e)
+        finally:
+            cursor.close()
+    return stats
+
+
+register("review_jobs", review_queue_stats)
+
+
+if __name__ == "__main__":
+    # run the workers as a standalone process next to the web server
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Process queued review jobs")
+    parser.add_argument("--workers", type=int, default=max(REVIEW_WORKERS, 2))
+    args = parser.parse_args()
+
+    pool = ReviewWorkerPool(workers=args.workers)
+    pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
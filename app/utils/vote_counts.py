@@ -0,0 +1,42 @@
+import argparse
+import json
+
+from ..config.db_connection import borrow
+
+with open("./app/utils/vote_queries.json", "r") as file:
+    queries = json.load(file)
+
+
+def reconcile_vote_counts(dry_run=False):
+    """
+    Recounts the votes of every review and repairs the upvotes/downvotes counters that drifted,
+    e.g. after PopulateDB loaded votes directly. The votes table is locked in SHARE mode while
+    counting so no vote is missed; reads are not blocked. Returns the repaired
+    (review_id, upvotes, downvotes) rows, rolled back instead when dry_run is set.
+    """
+    with borrow() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(queries["lock_votes_query"])
+            cursor.execute(queries["reconcile_vote_counts_query"])
+            repaired = cursor.fetchall()
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    print(f"{len(repaired)} review vote count(s) {'out of date' if dry_run else 'repaired'}")
+    return repaired
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repair the vote counters of the reviews from the votes table")
+    parser.add_argument("--dry-run", action="store_true", help="only report how many reviews drifted")
+    args = parser.parse_args()
+
+    reconcile_vote_counts(args.dry_run)
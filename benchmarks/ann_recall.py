@@ -0,0 +1,180 @@
+"""
+Recall and latency of the pgvector ANN indexes against exact search, as the table grows.
+
+A scratch table is filled with synthetic embeddings in growing steps. At each size the
+exact scan is timed first, then every index type is built and queried with a sweep of
+ef_search (HNSW) or probes (IVFFlat) values, through the same search_settings() the
+assistant queries use. Recall@k is measured against a brute-force numpy search.
+
+Synthetic vectors are the stored review embeddings plus noise (--source reviews), or random
+unit vectors (--source random) when there are none yet.
+
+Usage, from the repository root:
+    python -m benchmarks.ann_recall --sizes 1000,10000,50000 --output ann.json
+"""
+import argparse
+import sys
+
+import numpy as np
+from psycopg2.extras import execute_values
+from pgvector.psycopg2 import register_vector
+
+from app.config.vector_indexes import create_index_sql, search_settings
+from .common import Timer, add_output_arguments, database_connection, finish, latency_summary
+
+TABLE = "ann_benchmark_vectors"
+INDEX = "ann_benchmark_vectors_embedding_idx"
+
+
+def parse_ints(text):
+    return [int(value) for value in text.split(",") if value]
+
+
+def base_vectors(cursor, source, dim, rng):
+    if source == "reviews":
+        # real[] reads vector and halfvec columns alike
+        cursor.execute("SELECT embedding::real[] FROM review_embeddings WHERE embedding IS NOT NULL")
+        rows = [np.asarray(row[0], dtype=np.float32) for row in cursor.fetchall()]
+        if rows:
+            return np.stack(rows)
+        print("review_embeddings is empty, falling back to random vectors", file=sys.stderr)
+    return rng.standard_normal((1000, dim)).astype(np.float32)
+
+
+def synthesize(base, count, noise, rng):
+    """
+    count unit vectors, each a random base vector plus gaussian noise, so the synthetic set
+    keeps the clustering of the real embeddings.
+    """
+    picks = base[rng.integers(0, len(base), count)]
+    scale = noise * np.linalg.norm(picks, axis=1, keepdims=True) / np.sqrt(base.shape[1])
+    vectors = picks + rng.standard_normal(picks.shape).astype(np.float32) * scale
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_neighbours(vectors, queries, k):
+    # vectors are unit length, so the smallest cosine distance is the largest dot product
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+
+def run_queries(connection, queries, k, settings=("", ())):
+    settings_sql, settings_params = settings
+    sql = settings_sql + f"SELECT id FROM {TABLE} ORDER BY embedding <=> %s LIMIT %s"
+
+    results, latencies = [], []
+    cursor = connection.cursor()
+    for query in queries:
+        with Timer() as timer:
+            cursor.execute(sql, settings_params + (query, k))
+            rows = cursor.fetchall()
+        # ends the transaction so SET LOCAL does not leak into the next measurement
+        connection.commit()
+        latencies.append(timer.seconds * 1000)
+        results.append({row[0] for row in rows})
+    cursor.close()
+    return results, latencies
+
+
+def uses_index(connection, query, settings):
+    settings_sql, settings_params = settings
+    cursor = connection.cursor()
+    cursor.execute(settings_sql + f"EXPLAIN SELECT id FROM {TABLE} ORDER BY embedding <=> %s LIMIT 10",
+                   settings_params + (query,))
+    plan = "\n".join(row[0] for row in cursor.fetchall())
+    connection.commit()
+    cursor.close()
+    return INDEX in plan
+
+
+def recall(found, expected, k):
+    return round(float(np.mean([len(f & e) / k for f, e in zip(found, expected)])), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ANN recall@k and latency against exact search")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="comma separated table sizes, ascending")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--source", choices=["reviews", "random"], default="reviews")
+    parser.add_argument("--dim", type=int, default=768, help="vector size for --source random")
+    parser.add_argument("--noise", type=float, default=0.5, help="noise added to the review embeddings")
+    parser.add_argument("--indexes", default="hnsw,ivfflat")
+    parser.add_argument("--ef-search", default="10,20,40,80,160")
+    parser.add_argument("--probes", default="1,5,10,20,40")
+    parser.add_argument("--seed", type=int, default=0)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    connection = database_connection(autocommit=False)
+    register_vector(connection)
+    cursor = connection.cursor()
+
+    base = base_vectors(cursor, args.source, args.dim, rng)
+    dim = base.shape[1]
+    queries = synthesize(base, args.queries, args.noise, rng)
+
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"CREATE TABLE {TABLE} (id integer PRIMARY KEY, embedding vector({dim}))")
+    connection.commit()
+
+    sweeps = {"hnsw": ("ef_search", parse_ints(args.ef_search)), "ivfflat": ("probes", parse_ints(args.probes))}
+    vectors = np.empty((0, dim), dtype=np.float32)
+    results = {}
+
+    try:
+        for size in sorted(parse_ints(args.sizes)):
+            added = synthesize(base, size - len(vectors), args.noise, rng)
+            execute_values(cursor, f"INSERT INTO {TABLE} (id, embedding) VALUES %s",
+                           [(len(vectors) + i, vector) for i, vector in enumerate(added)], page_size=1000)
+            vectors = np.concatenate([vectors, added])
+            cursor.execute(f"ANALYZE {TABLE}")
+            connection.commit()
+
+            expected = exact_neighbours(vectors, queries, args.k)
+            found, latencies = run_queries(connection, queries, args.k)
+            size_results = {"exact": {f"recall@{args.k}": recall(found, expected, args.k), **latency_summary(latencies)}}
+            print(f"{size} rows: exact p50 {size_results['exact']['p50_ms']} ms", file=sys.stderr)
+
+            for index_type in args.indexes.split(","):
+                cursor.execute(f"DROP INDEX IF EXISTS {INDEX}")
+                connection.commit()
+                # the app's index statements are CONCURRENTLY, which needs autocommit
+                connection.autocommit = True
+                with Timer() as build:
+                    cursor.execute(create_index_sql(TABLE, INDEX, index_type, size))
+                connection.autocommit = False
+
+                parameter, values = sweeps[index_type]
+                index_results = {"build_s": round(build.seconds, 3)}
+                for value in values:
+                    settings = search_settings(index_type, ef_search=value, probes=value)
+                    found, latencies = run_queries(connection, queries, args.k, settings)
+                    index_results[f"{parameter}={value}"] = {
+                        f"recall@{args.k}": recall(found, expected, args.k),
+                        "uses_index": uses_index(connection, queries[0], settings),
+                        **latency_summary(latencies),
+                    }
+                    summary = index_results[f"{parameter}={value}"]
+                    print(f"{size} rows: {index_type} {parameter}={value} recall@{args.k} "
+                          f"{summary[f'recall@{args.k}']} p50 {summary['p50_ms']} ms p99 {summary['p99_ms']} ms",
+                          file=sys.stderr)
+                size_results[index_type] = index_results
+
+            cursor.execute(f"DROP INDEX IF EXISTS {INDEX}")
+            connection.commit()
+            results[str(size)] = size_results
+    finally:
+        connection.rollback()
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+    finish(args, "ann_recall", {"dim": dim, "queries": args.queries, "sizes": results}, higher_is_better=("recall",))
+
+
+if __name__ == "__main__":
+    main()
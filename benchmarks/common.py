@@ -0,0 +1,199 @@
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def latency_summary(latencies_ms):
+    return {
+        "count": len(latencies_ms),
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies_ms), 3),
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+
+
+def database_connection(autocommit=True):
+    """
+    Plain psycopg2 connection with the app's DB_* settings, outside the app's pool.
+    """
+    import psycopg2
+    from app.config import db_connection
+
+    connection = psycopg2.connect(
+        host=db_connection.db_host,
+        database=db_connection.db_name,
+        user=db_connection.db_user,
+        password=db_connection.db_pass,
+        port=db_connection.db_port,
+    )
+    connection.autocommit = autocommit
+    return connection
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+RESULT_MARKER = "BENCHMARK_RESULT "
+
+
+def emit(result):
+    """
+    Prints a child process result for run_child; the marker keeps it apart from whatever
+    the app itself prints.
+    """
+    print(RESULT_MARKER + json.dumps(result), flush=True)
+
+
+def run_child(args, env=None):
+    """
+    Runs "python <args>" from the repository root and returns the result it emit()ted, so
+    every measurement starts from a cold interpreter.
+    """
+    child_env = dict(os.environ)
+    child_env.update(env or {})
+    result = subprocess.run([sys.executable, *args], capture_output=True, text=True, env=child_env)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed with exit code {result.returncode}:\n{result.stderr[-2000:]}")
+
+    for line in result.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"{' '.join(args)} printed no result")
+
+
+def median_of(runs):
+    """
+    Merges repeated runs of the same nested dict, keeping the median of every numeric leaf.
+    """
+    first = runs[0]
+    if isinstance(first, dict):
+        return {key: median_of([run[key] for run in runs if key in run]) for key in first}
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        values = [run for run in runs if run is not None]
+        if not values:
+            return None
+        if all(isinstance(value, int) for value in values):
+            return statistics.median_low(values)
+        return round(statistics.median(values), 4)
+    return first
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline, threshold, higher_is_better=()):
+    """
+    Compares the numeric leaves of two result dicts. A metric regresses when it moved in the
+    wrong direction by more than threshold (a fraction of the baseline value). Metrics whose
+    name contains one of higher_is_better (e.g. "recall") are expected to go up, all others
+    (times, memory) to go down.
+    """
+    current_flat, baseline_flat = flatten(current), flatten(baseline)
+    changes, regressions = [], []
+    for name, before in sorted(baseline_flat.items()):
+        after = current_flat.get(name)
+        if after is None or not before:
+            continue
+        change = (after - before) / abs(before)
+        worse = -change if any(marker in name for marker in higher_is_better) else change
+        changes.append((name, before, after, change))
+        if worse > threshold:
+            regressions.append(name)
+    return changes, regressions
+
+
+def add_output_arguments(parser):
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to diff against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative change counted as a regression with --compare (default 0.2)")
+
+
+def finish(args, benchmark, results, higher_is_better=()):
+    """
+    Writes the results, diffs them against --compare when given and exits with status 1 if
+    any metric regressed, so the benchmark can gate a CI job.
+    """
+    report = {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+        print(f"results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if not args.compare:
+        return
+
+    with open(args.compare, "r") as file:
+        baseline = json.load(file)
+
+    changes, regressions = compare(results, baseline["results"], args.threshold, higher_is_better)
+    print(f"\ncompared with {args.compare} (commit {baseline.get('commit')})", file=sys.stderr)
+    for name, before, after, change in changes:
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"  {name}: {before} -> {after} ({change:+.1%}){flag}", file=sys.stderr)
+
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
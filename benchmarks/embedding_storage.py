@@ -0,0 +1,178 @@
+"""
+Size, speed and retrieval quality of the embedding storage profiles.
+
+Every profile (column type and Matryoshka dimension, e.g. halfvec:256) is loaded into a
+scratch table the way EmbeddingService and ensure_embedding_storage() store embeddings:
+truncated to the first dim values and renormalized. The table is indexed with the
+configured ANN index and measured for:
+    table_mb, index_mb   heap (with TOAST) and index size
+    cached_buffers       shared buffers held by the table and index after the queries,
+                         when the pg_buffercache extension is installed
+    p50_ms, p99_ms       latency of the top-k search through search_settings()
+    recall@k             of the indexed search against an exact full-precision search
+    exact_recall@k       of an exact search at the profile's dimension and precision against
+                         the same ground truth, the loss caused by the storage alone
+
+The corpus is the stored review embeddings (read back at full width, so run it before
+converting the columns), padded with noisy copies up to --size. Queries are held-out
+stored embeddings. halfvec profiles need pgvector 0.7 or newer.
+
+Usage, from the repository root:
+    python -m benchmarks.embedding_storage --profiles vector:768,halfvec:768,halfvec:256 --output storage.json
+"""
+import argparse
+import sys
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from app.config.embedding_storage import column_type, operator_class
+from app.config.vector_indexes import VECTOR_INDEX_TYPE, create_index_sql, search_settings
+from .ann_recall import base_vectors, synthesize
+from .common import Timer, add_output_arguments, database_connection, finish, latency_summary
+
+TABLE = "embedding_storage_benchmark"
+INDEX = "embedding_storage_benchmark_embedding_idx"
+
+
+def parse_profiles(text):
+    profiles = []
+    for item in text.split(","):
+        storage, _, dim = item.partition(":")
+        profiles.append((storage, int(dim)))
+    return profiles
+
+
+def truncate(vectors, dim):
+    vectors = vectors[:, :dim]
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top(vectors, queries, k):
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+
+def recall(found, expected, k):
+    return round(float(np.mean([len(f & e) / k for f, e in zip(found, expected)])), 4)
+
+
+def relation_sizes(cursor):
+    cursor.execute("SELECT pg_table_size(%s), pg_relation_size(%s)", (TABLE, INDEX))
+    table_bytes, index_bytes = cursor.fetchone()
+    return {"table_mb": round(table_bytes / 2 ** 20, 3), "index_mb": round(index_bytes / 2 ** 20, 3)}
+
+
+def cached_buffers(cursor):
+    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_buffercache'")
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute("""SELECT count(*) FROM pg_buffercache
+                      WHERE relfilenode IN (pg_relation_filenode(%s), pg_relation_filenode(%s))""",
+                   (TABLE, INDEX))
+    return cursor.fetchone()[0]
+
+
+def measure(connection, storage, dim, corpus, queries, expected, k, index_type):
+    cursor = connection.cursor()
+    stored = truncate(corpus, dim)
+    cast = column_type(storage, dim)
+
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"CREATE TABLE {TABLE} (id integer PRIMARY KEY, embedding {cast})")
+    execute_values(cursor, f"INSERT INTO {TABLE} (id, embedding) VALUES %s",
+                   [(i, "[" + ",".join(map(repr, vector.tolist())) + "]") for i, vector in enumerate(stored)],
+                   template=f"(%s, %s::{cast})", page_size=1000)
+    connection.commit()
+
+    connection.autocommit = True
+    with Timer() as build:
+        cursor.execute(create_index_sql(TABLE, INDEX, index_type, len(stored), storage=storage))
+    cursor.execute(f"VACUUM ANALYZE {TABLE}")
+    connection.autocommit = False
+
+    settings_sql, settings_params = search_settings(index_type)
+    sql = settings_sql + f"SELECT id FROM {TABLE} ORDER BY embedding <=> %s::{cast} LIMIT %s"
+    query_vectors = truncate(queries, dim)
+    found, latencies = [], []
+    for query in query_vectors:
+        literal = "[" + ",".join(map(repr, query.tolist())) + "]"
+        with Timer() as timer:
+            cursor.execute(sql, settings_params + (literal, k))
+            rows = cursor.fetchall()
+        connection.commit()
+        latencies.append(timer.seconds * 1000)
+        found.append({row[0] for row in rows})
+
+    # what the column keeps of each vector, searched exactly
+    precision = np.float16 if storage == "halfvec" else np.float32
+    exact = exact_top(stored.astype(precision).astype(np.float32), query_vectors, k)
+
+    result = {
+        "opclass": operator_class(storage),
+        "build_s": round(build.seconds, 3),
+        **relation_sizes(cursor),
+        "cached_buffers": cached_buffers(cursor),
+        f"recall@{k}": recall(found, expected, k),
+        f"exact_recall@{k}": recall(exact, expected, k),
+        **latency_summary(latencies),
+    }
+    cursor.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding storage profiles")
+    parser.add_argument("--profiles", default="vector:768,halfvec:768,halfvec:512,halfvec:256,halfvec:128",
+                        help="comma separated storage:dim pairs")
+    parser.add_argument("--size", type=int, default=10000, help="corpus size, padded with noisy copies")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.3, help="noise of the padding copies")
+    parser.add_argument("--index", choices=["hnsw", "ivfflat"],
+                        default=VECTOR_INDEX_TYPE if VECTOR_INDEX_TYPE != "none" else "hnsw")
+    parser.add_argument("--seed", type=int, default=0)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    connection = database_connection(autocommit=False)
+    cursor = connection.cursor()
+
+    vectors = base_vectors(cursor, "reviews", 768, rng)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    rng.shuffle(vectors)
+    held_out = min(args.queries, len(vectors) // 2)
+    queries = vectors[:held_out]
+    if held_out < args.queries:
+        queries = np.concatenate([queries, synthesize(vectors, args.queries - held_out, args.noise, rng)])
+    corpus = vectors[held_out:]
+    if len(corpus) < args.size:
+        corpus = np.concatenate([corpus, synthesize(corpus, args.size - len(corpus), args.noise, rng)])
+    connection.commit()
+
+    expected = exact_top(corpus, queries, args.k)
+    results = {"dim": corpus.shape[1], "size": len(corpus), "queries": len(queries), "index": args.index,
+               "profiles": {}}
+    try:
+        for storage, dim in parse_profiles(args.profiles):
+            name = f"{storage}:{dim}"
+            results["profiles"][name] = measure(connection, storage, dim, corpus, queries, expected,
+                                                args.k, args.index)
+            summary = results["profiles"][name]
+            print(f"{name}: table {summary['table_mb']} MB, index {summary['index_mb']} MB, "
+                  f"recall@{args.k} {summary[f'recall@{args.k}']} (exact {summary[f'exact_recall@{args.k}']}), "
+                  f"p50 {summary['p50_ms']} ms", file=sys.stderr)
+    finally:
+        connection.rollback()
+        connection.autocommit = True
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cursor.close()
+        connection.close()
+
+    finish(args, "embedding_storage", results, higher_is_better=("recall",))
+
+
+if __name__ == "__main__":
+    main()
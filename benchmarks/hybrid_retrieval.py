@@ -0,0 +1,115 @@
+"""
+Cost of the QnA retrieval step: two vector searches against one combined statement.
+
+Three ways of fetching the relevant reviews and courses for one question are timed
+against the real review_embeddings and course_embeddings tables:
+    separate_list    two statements with the embedding sent as query_embedding.tolist()
+                     (an ARRAY[...] literal cast to vector), the previous code path
+    separate_vector  two statements with the embedding sent through the pgvector adapter
+    hybrid           qna_retrieval_query, one statement and the embedding sent once
+
+Parameter serialization (building the statement text on the client) is measured on its
+own, together with the bytes sent per question.
+
+Usage, from the repository root:
+    python -m benchmarks.hybrid_retrieval --iterations 200 --output hybrid.json
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+from pgvector.psycopg2 import register_vector
+
+from app.config.embedding_storage import with_embedding_type
+from app.config.vector_indexes import search_settings
+from .common import Timer, add_output_arguments, database_connection, finish, latency_summary
+
+with open("./app/utils/assistant_queries.json", "r") as file:
+    queries = with_embedding_type(json.load(file))
+
+
+def embedding_dim(cursor):
+    cursor.execute("SELECT vector_dims(embedding) FROM review_embeddings WHERE embedding IS NOT NULL LIMIT 1")
+    row = cursor.fetchone()
+    return row[0] if row else 768
+
+
+def statements(mode, embedding):
+    """
+    The (sql, params) pairs one question costs in the given mode.
+    """
+    settings, settings_params = search_settings()
+    if mode == "hybrid":
+        return [(settings + queries["qna_retrieval_query"], settings_params + (embedding,))]
+
+    value = embedding.tolist() if mode == "separate_list" else embedding
+    return [
+        (settings + queries["relevant_reviews_query"], settings_params + (value,)),
+        (queries["curriculum_query"], (value,)),
+    ]
+
+
+def measure(connection, mode, embeddings):
+    cursor = connection.cursor()
+    latencies, serialize_us, payload_bytes = [], [], []
+
+    for embedding in embeddings:
+        pairs = statements(mode, embedding)
+
+        with Timer() as serialize:
+            payload = [cursor.mogrify(sql, params) for sql, params in pairs]
+        serialize_us.append(serialize.seconds * 1e6)
+        payload_bytes.append(sum(len(text) for text in payload))
+
+        with Timer() as timer:
+            for sql, params in pairs:
+                cursor.execute(sql, params)
+                cursor.fetchall()
+        connection.commit()
+        latencies.append(timer.seconds * 1000)
+
+    cursor.close()
+    return {
+        "round_trips": len(statements(mode, embeddings[0])),
+        "serialize_us": round(float(np.median(serialize_us)), 2),
+        "payload_bytes": int(np.median(payload_bytes)),
+        **latency_summary(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare separate and combined QnA retrieval statements")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+
+    connection = database_connection(autocommit=False)
+    register_vector(connection)
+    cursor = connection.cursor()
+    dim = embedding_dim(cursor)
+    cursor.close()
+    connection.commit()
+
+    rng = np.random.default_rng(args.seed)
+    embeddings = rng.standard_normal((args.iterations + args.warmup, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    results = {}
+    try:
+        for mode in ("separate_list", "separate_vector", "hybrid"):
+            measure(connection, mode, embeddings[:args.warmup])
+            results[mode] = measure(connection, mode, embeddings[args.warmup:])
+            print(f"{mode}: {results[mode]['round_trips']} round trip(s), p50 {results[mode]['p50_ms']} ms, "
+                  f"p99 {results[mode]['p99_ms']} ms, serialize {results[mode]['serialize_us']} us, "
+                  f"{results[mode]['payload_bytes']} bytes", file=sys.stderr)
+    finally:
+        connection.close()
+
+    finish(args, "hybrid_retrieval", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Round trips and latency of the instructor page's database work.
+
+Two ways of loading what /instructor/<name>/reviews shows (apart from the consensus
+summary, which comes from the summary store) are timed for a sample of instructors:
+    separate   validate_instructor, departments, courses and average rating (each of which
+               validates the instructor again), then the vote check and the review list,
+               the previous code path, kept here since the app no longer uses it
+    profile    Instructor.get_instructor_profile, one statement
+
+Round trips are counted on the cursor, and both paths are checked to return the same
+profile. The page is loaded as a voter (the user with the most votes) unless --anonymous
+is given.
+
+Usage, from the repository root:
+    python -m benchmarks.instructor_profile --instructors 20 --iterations 20 --output profile.json
+"""
+import argparse
+import sys
+
+from psycopg2.extensions import cursor as base_cursor
+
+from app.models.intructors import Instructor, VOTE_NAMES
+from app.utils.helper import validate_instructor
+from .common import Timer, add_output_arguments, database_connection, finish, latency_summary
+
+
+class CountingCursor(base_cursor):
+    executed = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.executed += 1
+        return super().execute(query, vars)
+
+
+def column(cursor, instructor_name, query):
+    cursor.execute(query, validate_instructor(cursor, instructor_name))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def reviews(cursor, instructor_first, instructor_last, username):
+    cursor.execute("""SELECT DISTINCT r.review_id
+                      FROM review r
+                      JOIN votes v ON r.review_id = v.review_id
+                      WHERE r.instructor_first = %s AND r.instructor_last = %s AND v.username = %s""",
+                   (instructor_first, instructor_last, username))
+    if cursor.fetchone() is not None:
+        vote = "(SELECT vote_type FROM votes WHERE review_id = r.review_id AND username = %s)"
+        params = (username, instructor_first, instructor_last)
+    else:
+        vote = "NULL"
+        params = (instructor_first, instructor_last)
+
+    cursor.execute(f"""SELECT r.review_id, r.comment, r.rating, r.post_time, r.last_updated, r.course_number,
+                              r.upvotes, r.downvotes, {vote}
+                       FROM review r
+                       WHERE r.instructor_first = %s AND r.instructor_last = %s
+                       ORDER BY r.post_time DESC""", params)
+    return [{
+        "review_id": row[0],
+        "comment": row[1],
+        "rating": row[2],
+        "post_time": row[3],
+        "last_updated": row[4],
+        "course_number": row[5],
+        "upvotes": row[6] or 0,
+        "downvotes": row[7] or 0,
+        "user_vote": VOTE_NAMES.get(row[8]),
+    } for row in cursor.fetchall()]
+
+
+def separate(cursor, instructor_name, username):
+    instructor_first, instructor_last = validate_instructor(cursor, instructor_name)
+    avg_rating = column(cursor, instructor_name, """SELECT avg_rating
+                                                    FROM instructor_stats
+                                                    WHERE instructor_first = %s AND instructor_last = %s""")
+    return {
+        "first_name": instructor_first,
+        "last_name": instructor_last,
+        "departments": column(cursor, instructor_name, """SELECT department_name
+                                                          FROM instructor_to_department
+                                                          WHERE instructor_first = %s AND instructor_last = %s"""),
+        "courses": column(cursor, instructor_name, """SELECT course_number
+                                                      FROM course_section
+                                                      WHERE instructor_first = %s AND instructor_last = %s"""),
+        "avg_rating": avg_rating[0] if avg_rating else None,
+        "reviews": reviews(cursor, instructor_first, instructor_last, username),
+    }
+
+
+def profile(cursor, instructor_name, username):
+    return Instructor.get_instructor_profile(cursor, instructor_name, username)
+
+
+def sample(cursor, count):
+    """
+    The instructors with the most reviews, the pages that cost the most.
+    """
+    cursor.execute("""SELECT i.first_name, i.last_name
+                      FROM instructors i
+                      LEFT JOIN review r ON r.instructor_first = i.first_name AND r.instructor_last = i.last_name
+                      WHERE position(' ' IN i.first_name) = 0 AND position(' ' IN i.last_name) = 0
+                      GROUP BY i.first_name, i.last_name
+                      ORDER BY count(r.review_id) DESC, i.last_name
+                      LIMIT %s""", (count,))
+    return [f"{first} {last}" for first, last in cursor.fetchall()]
+
+
+def voter(cursor):
+    cursor.execute("SELECT username FROM votes GROUP BY username ORDER BY count(*) DESC LIMIT 1")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def normalized(page):
+    # the page only cares about the multiset of courses and departments, not their order
+    return {**page, "departments": sorted(page["departments"]), "courses": sorted(page["courses"])}
+
+
+def measure(connection, load, names, username, iterations):
+    cursor = connection.cursor()
+    latencies, round_trips = [], []
+
+    for _ in range(iterations):
+        for name in names:
+            before = CountingCursor.executed
+            with Timer() as timer:
+                load(cursor, name, username)
+            latencies.append(timer.seconds * 1000)
+            round_trips.append(CountingCursor.executed - before)
+
+    cursor.close()
+    return {"round_trips": max(round_trips), **latency_summary(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the separate instructor page queries with the single profile query")
+    parser.add_argument("--instructors", type=int, default=20, help="instructors with the most reviews to load")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--anonymous", action="store_true", help="load the pages without a logged in user")
+    add_output_arguments(parser)
+    args = parser.parse_args()
+
+    connection = database_connection()
+    connection.cursor_factory = CountingCursor
+    cursor = connection.cursor()
+    names = sample(cursor, args.instructors)
+    username = None if args.anonymous else voter(cursor)
+    if not names:
+        sys.exit("no instructors in the database")
+
+    mismatches = [name for name in names
+                  if normalized(separate(cursor, name, username)) != normalized(profile(cursor, name, username))]
+    cursor.close()
+    if mismatches:
+        print(f"profiles differ for {', '.join(mismatches)}", file=sys.stderr)
+
+    results = {"instructors": len(names), "voter": username is not None, "mismatches": len(mismatches)}
+    for mode, load in (("separate", separate), ("profile", profile)):
+        results[mode] = measure(connection, load, names, username, args.iterations)
+        print(f"{mode}: {results[mode]['round_trips']} round trip(s), p50 {results[mode]['p50_ms']} ms, "
+              f"p99 {results[mode]['p99_ms']} ms", file=sys.stderr)
+    connection.close()
+
+    finish(args, "instructor_profile", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Prefill saved by the prompt prefix KV-cache, per intent.
+
+For every prompt kind (consensus summary, curriculum, QnA, comparison and conversation
+summary) a first-question conversation is built from the real templates in prompts.json
+and a synthetic context of --reviews reviews and --courses courses. Time to first token
+(prefill plus one decoded token) is measured with the whole prompt prefilled and with the
+cached prefix copied in, through the same PrefixCache the assistant uses. prefix_reused
+tells whether the prefix's tokens start the prompt's, when they do not (tokens merged
+across the end of the prefix) the cached run prefills the whole prompt too.
+
+Needs the text-generation model (and an HF token with access to it).
+
+Usage, from the repository root:
+    python -m benchmarks.prefix_cache --iterations 10 --output prefix.json
+"""
+import argparse
+import sys
+
+from app.models.assistant import get_assistant_roles
+from app.models.context_pydantic import (CourseContext, CourseRecommendationContext, MiscellaneousInfoContext,
+                                         ProfessorComparisonContext, ReviewContext)
+from app.models.prefix_cache import PrefixCache
+from .common import Timer, add_output_arguments, finish, latency_summary
+
+QUESTION = "Which professor is best for someone new to programming who wants clear lectures?"
+COMMENT = ("Lectures were well organized and the projects were challenging but fair. "
+           "Office hours helped a lot before the exams.")
+
+
+def sample_context(reviews, courses):
+    review_rows = [ReviewContext(professor_fname=f"First{i % 4}", professor_lname=f"Last{i % 4}",
+                                 course_code=f"CS{1000 + i % 7}", comment=COMMENT) for i in range(reviews)]
+    course_rows = [CourseContext(course_code=f"CS{1000 + i}",
+                                 course_desc="Introduction to data structures, algorithms and their analysis.")
+                   for i in range(courses)]
+    return review_rows, course_rows
+
+
+def conversations(roles, reviews, courses):
+    """
+    One first-question conversation per prompt kind, built like the assistant builds them.
+    """
+    prompts = roles.prompts
+    review_rows, course_rows = sample_context(reviews, courses)
+    half = max(len(review_rows) // 2, 1)
+
+    curriculum = CourseRecommendationContext(user_preferences=QUESTION, matching_courses=course_rows)
+    qna = MiscellaneousInfoContext(question=QUESTION, relevant_reviews=review_rows, relevant_courses=course_rows)
+    comparison = ProfessorComparisonContext(
+        professor1_fname="First0", professor1_lname="Last0",
+        professor1_courses=course_rows[:3], professor1_reviews=review_rows[:half],
+        professor2_fname="First1", professor2_lname="Last1",
+        professor2_courses=course_rows[3:6], professor2_reviews=review_rows[half:],
+    )
+    turns = [(QUESTION, COMMENT)] * 3
+
+    messages = {
+        "summary": roles.create_summary_prompt([COMMENT] * reviews),
+        "curriculum": [prompts["curriculum_prompt"].format(formatted_context=curriculum.format_for_llm())],
+        "qna": [prompts["qna_prompt"].format(formatted_context=qna.format_for_llm())],
+        "comparison": [prompts["comparison_prompt"].format(formatted_context=comparison.format_for_llm())],
+        "conversation_summary": [prompts["conversation_summary_prompt"].format(
+            previous_summary="",
+            turns="\n".join(f"Student: {question}\nAssistant: {reply}" for question, reply in turns),
+        )],
+    }
+    return {name: roles.build_conversation(parts) for name, parts in messages.items()}
+
+
+def time_to_first_token(cache, conversation, reuse, iterations):
+    latencies = []
+    for _ in range(iterations):
+        with Timer() as timer:
+            cache.generate(conversation, reuse=reuse, max_new_tokens=1, do_sample=False)
+        latencies.append(timer.seconds * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time to first token with and without the prefix cache")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--reviews", type=int, default=10, help="reviews in each synthetic context")
+    parser.add_argument("--courses", type=int, default=10, help="courses in each synthetic context")
+    add_output_arguments(parser)
+    args = parser.parse_args()
+
+    roles = get_assistant_roles()
+    cache = roles.prefix_cache
+    tokenizer = cache.pipe.tokenizer
+
+    results = {}
+    for name, conversation in conversations(roles, args.reviews, args.courses).items():
+        matched, prefix, rest = cache.split(conversation)
+        # the first cached call computes the prefix, warm-up keeps it out of the measurement
+        for reuse in (False, True):
+            time_to_first_token(cache, conversation, reuse, args.warmup)
+
+        full = latency_summary(time_to_first_token(cache, conversation, False, args.iterations))
+        cached = latency_summary(time_to_first_token(cache, conversation, True, args.iterations))
+        prefix_ids = tokenizer(prefix, add_special_tokens=False, return_tensors="pt").input_ids
+        prompt_ids = tokenizer(prefix + rest, add_special_tokens=False, return_tensors="pt").input_ids
+        results[name] = {
+            "prefix": matched,
+            "prefix_reused": PrefixCache.starts_with(prompt_ids, prefix_ids),
+            "prefix_tokens": prefix_ids.shape[1],
+            "prompt_tokens": prompt_ids.shape[1],
+            "full_prefill": full,
+            "cached_prefix": cached,
+            "speedup": round(full["p50_ms"] / cached["p50_ms"], 3) if cached["p50_ms"] else None,
+        }
+        print(f"{name}: {results[name]['prefix_tokens']}/{results[name]['prompt_tokens']} prompt tokens cached, "
+              f"p50 {full['p50_ms']} ms -> {cached['p50_ms']} ms (x{results[name]['speedup']})", file=sys.stderr)
+
+    finish(args, "prefix_cache", results, higher_is_better=("speedup",))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Full-precision against quantized CPU inference backends.
+
+Every backend is loaded in a fresh interpreter:
+    llm         text-generation model per INFERENCE_BACKEND value (full, int8, int4): load time,
+                RSS after loading, greedy generation tokens/sec over one prompt per intent
+                (the prompts of benchmarks.prefix_cache) and the generated token ids
+    embeddings  embedding model per EMBEDDING_BACKEND value (full, int8): load time, RSS after
+                loading, documents/sec and queries/sec over a corpus of review comments
+
+Output agreement is measured against the "full" backend: for generation the share of
+prompts with identical output and the mean length of the common prefix relative to the
+full-precision output; for embeddings the mean cosine similarity to the full-precision
+vectors and the recall@10 of the quantized ranking of the corpus for each query.
+
+Usage, from the repository root:
+    python -m benchmarks.quantization --output quantization.json
+    python -m benchmarks.quantization --llm-backends full,int8 --skip-embeddings
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from .common import (Timer, add_output_arguments, current_rss_mb, database_connection, emit, finish, peak_rss_mb,
+                     run_child)
+
+SAMPLE_TEXTS = [
+    "Great lecturer, explains every concept with examples and is always available in office hours.",
+    "The exams were much harder than the homework and grading felt inconsistent.",
+    "Projects take a lot of time but you learn a lot about real world software development.",
+    "Very organized course with clear rubrics, slides are posted before every class.",
+    "Attendance is mandatory and the lectures mostly repeat the textbook.",
+]
+
+
+def child_llm(backend, context_items, max_new_tokens):
+    import torch
+    from app.models.assistant import get_assistant_roles
+    from app.models.quantization import load_generation_pipeline
+    from .prefix_cache import conversations
+
+    roles = get_assistant_roles()
+    with Timer() as load:
+        pipe = load_generation_pipeline(roles.model_id, backend)
+    rss_after_load = current_rss_mb()
+
+    tokenizer, model = pipe.tokenizer, pipe.model
+    outputs, seconds, generated = [], 0.0, 0
+    for conversation in list(conversations(roles, context_items, context_items).values()):
+        input_ids = tokenizer.apply_chat_template(conversation, add_generation_prompt=True, return_tensors="pt")
+        input_ids = input_ids.to(model.device)
+        with torch.no_grad(), Timer() as timer:
+            output = model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                    max_new_tokens=max_new_tokens, do_sample=False,
+                                    pad_token_id=tokenizer.eos_token_id)
+        new_tokens = output[0, input_ids.shape[1]:].tolist()
+        seconds += timer.seconds
+        generated += len(new_tokens)
+        outputs.append(new_tokens)
+
+    emit({
+        "load_s": round(load.seconds, 3),
+        "rss_after_load_mb": rss_after_load,
+        "peak_rss_mb": peak_rss_mb(),
+        "tokens_per_s": round(generated / seconds, 3) if seconds else None,
+        "outputs": outputs,
+    })
+
+
+def child_embeddings(backend, texts_file, queries):
+    from app.models.embeddings import EmbeddingService
+
+    with open(texts_file, "r") as file:
+        texts = json.load(file)
+
+    service = EmbeddingService(backend=backend, batch_window_ms=0)
+    with Timer() as load:
+        service.model
+    rss_after_load = current_rss_mb()
+
+    # the first batch pays for lazy initialization
+    service.encode_documents(texts[:8])
+    with Timer() as documents_timer:
+        documents = service.encode_documents(texts)
+    with Timer() as queries_timer:
+        query_vectors = service.encode_queries(texts[:queries])
+
+    emit({
+        "load_s": round(load.seconds, 3),
+        "rss_after_load_mb": rss_after_load,
+        "peak_rss_mb": peak_rss_mb(),
+        "documents_per_s": round(len(texts) / documents_timer.seconds, 3),
+        "queries_per_s": round(queries / queries_timer.seconds, 3),
+        "documents": np.round(np.asarray(documents, dtype=np.float32), 6).tolist(),
+        "queries": np.round(np.asarray(query_vectors, dtype=np.float32), 6).tolist(),
+    })
+
+
+def corpus(size):
+    """
+    Review comments from the database, or the sample texts repeated with a counter when it
+    cannot be reached or has too few reviews.
+    """
+    texts = []
+    try:
+        connection = database_connection()
+        cursor = connection.cursor()
+        cursor.execute("SELECT comment FROM review WHERE comment IS NOT NULL AND comment <> '' LIMIT %s", (size,))
+        texts = [row[0] for row in cursor.fetchall()]
+        connection.close()
+    except Exception as e:
+        print(f"using sample texts, reviews could not be read: {e}", file=sys.stderr)
+
+    while len(texts) < size:
+        texts.append(f"{SAMPLE_TEXTS[len(texts) % len(SAMPLE_TEXTS)]} ({len(texts)})")
+    return texts
+
+
+def generation_agreement(reference, outputs):
+    exact, prefix = [], []
+    for expected, got in zip(reference, outputs):
+        common = 0
+        for a, b in zip(expected, got):
+            if a != b:
+                break
+            common += 1
+        exact.append(expected == got)
+        prefix.append(common / max(len(expected), 1))
+    return {"exact_match": round(float(np.mean(exact)), 4), "prefix_agreement": round(float(np.mean(prefix)), 4)}
+
+
+def unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def embedding_agreement(reference, result, k=10):
+    documents, expected_documents = unit(result["documents"]), unit(reference["documents"])
+    queries, expected_queries = unit(result["queries"]), unit(reference["queries"])
+
+    cosine = float(np.mean(np.sum(documents * expected_documents, axis=1)))
+    k = min(k, len(documents))
+    found = np.argsort(-(queries @ documents.T), axis=1)[:, :k]
+    expected = np.argsort(-(expected_queries @ expected_documents.T), axis=1)[:, :k]
+    recall = np.mean([len(set(f) & set(e)) / k for f, e in zip(found.tolist(), expected.tolist())])
+    return {"cosine_to_full": round(cosine, 5), f"recall@{k}": round(float(recall), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-precision and quantized inference backends")
+    parser.add_argument("--llm-backends", default="full,int8,int4")
+    parser.add_argument("--embedding-backends", default="full,int8")
+    parser.add_argument("--skip-llm", action="store_true")
+    parser.add_argument("--skip-embeddings", action="store_true")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--context-items", type=int, default=5, help="reviews and courses in each prompt")
+    parser.add_argument("--texts", type=int, default=256, help="documents embedded per backend")
+    parser.add_argument("--queries", type=int, default=32)
+    add_output_arguments(parser)
+    parser.add_argument("--child", choices=["llm", "embeddings"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--texts-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "llm":
+        return child_llm(args.backend, args.context_items, args.max_new_tokens)
+    if args.child == "embeddings":
+        return child_embeddings(args.backend, args.texts_file, args.queries)
+
+    # the models load on the children's own schedule
+    env = {"WARMUP_MODELS": "0", "REVIEW_WORKERS": "0"}
+    results = {}
+
+    if not args.skip_llm:
+        runs = {}
+        for backend in args.llm_backends.split(","):
+            runs[backend] = run_child(["-m", "benchmarks.quantization", "--child", "llm", "--backend", backend,
+                                       "--context-items", str(args.context_items),
+                                       "--max-new-tokens", str(args.max_new_tokens)], env)
+            print(f"llm {backend}: {runs[backend]['tokens_per_s']} tokens/s, "
+                  f"{runs[backend]['rss_after_load_mb']} MB after load", file=sys.stderr)
+
+        outputs = {backend: run.pop("outputs") for backend, run in runs.items()}
+        for backend, run in runs.items():
+            if "full" in outputs and backend != "full":
+                run.update(generation_agreement(outputs["full"], outputs[backend]))
+        results["llm"] = runs
+
+    if not args.skip_embeddings:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as file:
+            json.dump(corpus(args.texts), file)
+        try:
+            runs = {}
+            for backend in args.embedding_backends.split(","):
+                runs[backend] = run_child(["-m", "benchmarks.quantization", "--child", "embeddings",
+                                           "--backend", backend, "--texts-file", file.name,
+                                           "--queries", str(args.queries)], env)
+                print(f"embeddings {backend}: {runs[backend]['documents_per_s']} documents/s, "
+                      f"{runs[backend]['rss_after_load_mb']} MB after load", file=sys.stderr)
+        finally:
+            os.unlink(file.name)
+
+        results["embeddings"] = {}
+        for backend, run in runs.items():
+            summary = {key: value for key, value in run.items() if key not in ("documents", "queries")}
+            if "full" in runs and backend != "full":
+                summary.update(embedding_agreement(runs["full"], run))
+            results["embeddings"][backend] = summary
+
+    finish(args, "quantization", results,
+           higher_is_better=("per_s", "exact_match", "agreement", "cosine", "recall"))
+
+
+if __name__ == "__main__":
+    main()
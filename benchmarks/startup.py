@@ -0,0 +1,166 @@
+"""
+Cold-start profile of the web app.
+
+Every stage runs in a fresh interpreter:
+    imports        wall time of "import app", plus the cumulative import time of every app.*
+                   module from python -X importtime
+    models         AssistantRoles construction, embedding model (SentenceTransformer) load and
+                   text-generation pipeline load, with RSS after each stage
+    first_request  time from interpreter start until each key route first answers successfully
+
+Usage, from the repository root:
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --compare startup.json --skip-models
+"""
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+PROCESS_START = time.perf_counter()
+
+from .common import (Timer, add_output_arguments, current_rss_mb, emit, finish, median_of, peak_rss_mb,
+                     run_child)
+
+# routes checked for time-to-first-successful-request, login-required ones get a session
+ROUTES = [
+    ("/auth/login", False),
+    ("/", False),
+    ("/ready", False),
+    ("/search-page", True),
+    ("/search?q=CS&mode=course", True),
+]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def stage(name, started, results):
+    results[name] = {
+        "seconds": round(time.perf_counter() - started, 4),
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def child_imports():
+    results = {}
+    started = time.perf_counter()
+    import app  # noqa: F401
+    stage("import_app", started, results)
+    emit(results)
+
+
+def child_models():
+    results = {}
+    started = time.perf_counter()
+    import app  # noqa: F401
+    stage("import_app", started, results)
+
+    from app.models.assistant import AssistantRoles
+    from app.models.embeddings import get_embedding_service
+
+    started = time.perf_counter()
+    roles = AssistantRoles()
+    stage("assistant_roles", started, results)
+
+    started = time.perf_counter()
+    get_embedding_service().model
+    stage("sentence_transformer", started, results)
+
+    started = time.perf_counter()
+    roles.pipe
+    stage("llm_pipeline", started, results)
+
+    emit(results)
+
+
+def child_first_request(user):
+    from app import app
+
+    results = {"import_app_s": round(time.perf_counter() - PROCESS_START, 4)}
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = user
+
+    for route, needs_login in ROUTES:
+        with Timer() as timer:
+            response = (client if needs_login else app.test_client()).get(route)
+        results[route] = {
+            "status": response.status_code,
+            "ok": response.status_code < 400,
+            "request_s": round(timer.seconds, 4),
+            "since_start_s": round(time.perf_counter() - PROCESS_START, 4),
+        }
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    emit(results)
+
+
+def import_times(min_ms):
+    """
+    Cumulative import time in milliseconds of every app.* module taking at least min_ms,
+    from python -X importtime. Faster modules are left out, their timings are mostly noise.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import app failed:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and (match.group(4) == "app" or match.group(4).startswith("app.")):
+            cumulative_ms = int(match.group(2)) / 1000
+            if cumulative_ms >= min_ms:
+                modules[match.group(4)] = round(cumulative_ms, 3)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import, model load and first-request times")
+    parser.add_argument("--repeat", type=int, default=3, help="cold runs per stage, the median is reported")
+    parser.add_argument("--skip-models", action="store_true", help="do not load the embedding and LLM models")
+    parser.add_argument("--min-module-ms", type=float, default=5.0,
+                        help="only report app modules whose cumulative import takes at least this long")
+    parser.add_argument("--user", default="benchmark", help="session user id for login-required routes")
+    parser.add_argument("--child", choices=["imports", "models", "first_request"], help=argparse.SUPPRESS)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child == "imports":
+        return child_imports()
+    if args.child == "models":
+        return child_models()
+    if args.child == "first_request":
+        return child_first_request(args.user)
+
+    # background work would only add noise to a cold start measurement
+    env = {"WARMUP_MODELS": "0", "REVIEW_WORKERS": "0"}
+
+    def repeated(child, *extra):
+        runs = []
+        for _ in range(args.repeat):
+            with Timer() as timer:
+                run = run_child(["-m", "benchmarks.startup", "--child", child, *extra], env)
+            run["process_s"] = round(timer.seconds, 4)
+            runs.append(run)
+        return median_of(runs)
+
+    results = {
+        "imports": repeated("imports"),
+        "module_import_ms": median_of([import_times(args.min_module_ms) for _ in range(args.repeat)]),
+        "first_request": repeated("first_request", "--user", args.user),
+    }
+    if not args.skip_models:
+        results["models"] = repeated("models")
+
+    failed = [route for route, _ in ROUTES if not results["first_request"][route]["ok"]]
+    if failed:
+        print(f"routes without a successful response: {', '.join(failed)}", file=sys.stderr)
+
+    finish(args, "startup", results)
+
+
+if __name__ == "__main__":
+    main()
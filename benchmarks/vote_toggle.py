@@ -0,0 +1,204 @@
+"""
+Voting throughput under concurrent clicks.
+
+--clients threads, each with its own connection, cast votes as fast as they can for
+--seconds. Every vote is a random up/down click by one of --users users on one of --reviews
+reviews, so the same user regularly clicks the same review from two clients at once. Two
+ways of recording a vote are compared:
+    separate   check the vote, then insert, update or delete it, then read the counts,
+               the previous code path (without its setval call), kept here since the app
+               no longer uses it
+    toggle     Votes.toggle_vote, one statement
+
+Reported per mode: votes/sec, p50/p99 latency, round trips per vote (statements plus the
+commit), failed votes by error, and whether the review counters still match the votes
+table afterwards.
+
+The users are existing accounts without a vote on the chosen reviews. Their votes on these
+reviews are deleted and the reviews' counters recomputed after every mode.
+
+Usage, from the repository root:
+    python -m benchmarks.vote_toggle --clients 8 --users 4 --reviews 2 --seconds 10 --output votes.json
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+import psycopg2
+from psycopg2.extensions import cursor as base_cursor
+
+from app.models.votes import Votes
+from .common import add_output_arguments, database_connection, finish, latency_summary
+
+
+class CountingCursor(base_cursor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executed = 0
+
+    def execute(self, query, vars=None):
+        self.executed += 1
+        return super().execute(query, vars)
+
+
+def separate(cursor, review_id, username, vote_type):
+    cursor.execute("SELECT vote_id, vote_type FROM votes WHERE review_id = %s AND username = %s", (review_id, username))
+    existing_vote = cursor.fetchone()
+    if existing_vote and existing_vote[1] == vote_type:
+        cursor.execute("""WITH deleted AS (DELETE FROM votes WHERE vote_id = %s RETURNING review_id, vote_type)
+                          UPDATE review r
+                          SET upvotes   = r.upvotes - (d.vote_type = 1)::integer,
+                              downvotes = r.downvotes - (d.vote_type = -1)::integer
+                          FROM deleted d
+                          WHERE r.review_id = d.review_id""", (existing_vote[0],))
+    elif existing_vote:
+        cursor.execute("""WITH old AS (SELECT vote_id, vote_type FROM votes WHERE vote_id = %s FOR UPDATE),
+                               updated AS (UPDATE votes v
+                                           SET vote_type = %s
+                                           FROM old
+                                           WHERE v.vote_id = old.vote_id
+                                           RETURNING v.review_id, v.vote_type AS new_type, old.vote_type AS old_type)
+                          UPDATE review r
+                          SET upvotes   = r.upvotes + (u.new_type = 1)::integer - (u.old_type = 1)::integer,
+                              downvotes = r.downvotes + (u.new_type = -1)::integer - (u.old_type = -1)::integer
+                          FROM updated u
+                          WHERE r.review_id = u.review_id""", (existing_vote[0], vote_type))
+    else:
+        cursor.execute("""WITH inserted AS (INSERT INTO votes (review_id, username, vote_type)
+                                            VALUES (%s, %s, %s)
+                                            RETURNING review_id, vote_type)
+                          UPDATE review r
+                          SET upvotes   = r.upvotes + (i.vote_type = 1)::integer,
+                              downvotes = r.downvotes + (i.vote_type = -1)::integer
+                          FROM inserted i
+                          WHERE r.review_id = i.review_id""", (review_id, username, vote_type))
+    cursor.execute("SELECT upvotes, downvotes FROM review WHERE review_id = %s", (review_id,))
+    return cursor.fetchone()
+
+
+def toggle(cursor, review_id, username, vote_type):
+    return Votes.toggle_vote(cursor, review_id, username, vote_type)
+
+
+def client(vote, reviews, users, deadline, seed, results):
+    rng = random.Random(seed)
+    connection = database_connection(autocommit=False)
+    cursor = connection.cursor(cursor_factory=CountingCursor)
+    latencies, round_trips, errors = [], [], {}
+
+    while time.perf_counter() < deadline:
+        review_id, username, vote_type = rng.choice(reviews), rng.choice(users), rng.choice((1, -1))
+        executed = cursor.executed
+        start = time.perf_counter()
+        try:
+            vote(cursor, review_id, username, vote_type)
+            connection.commit()
+        except psycopg2.Error as e:
+            connection.rollback()
+            name = type(e).__name__
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        round_trips.append(cursor.executed - executed + 1)
+
+    cursor.close()
+    connection.close()
+    results.append((latencies, round_trips, errors))
+
+
+def pick(cursor, review_count, user_count):
+    cursor.execute("SELECT review_id FROM review ORDER BY review_id LIMIT %s", (review_count,))
+    reviews = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""SELECT u.username
+                      FROM users u
+                      WHERE NOT EXISTS (SELECT 1 FROM votes v
+                                        WHERE v.username = u.username AND v.review_id = ANY(%s))
+                      ORDER BY u.username
+                      LIMIT %s""", (reviews, user_count))
+    return reviews, [row[0] for row in cursor.fetchall()]
+
+
+def counters_match(cursor, reviews):
+    cursor.execute("""SELECT count(*)
+                      FROM review r
+                      WHERE r.review_id = ANY(%s)
+                        AND (r.upvotes, r.downvotes) IS DISTINCT FROM
+                            ((SELECT count(*) FROM votes v WHERE v.review_id = r.review_id AND v.vote_type = 1),
+                             (SELECT count(*) FROM votes v WHERE v.review_id = r.review_id AND v.vote_type = -1))""",
+                   (reviews,))
+    return cursor.fetchone()[0] == 0
+
+
+def reset(cursor, reviews, users):
+    cursor.execute("DELETE FROM votes WHERE review_id = ANY(%s) AND username = ANY(%s)", (reviews, users))
+    cursor.execute("""UPDATE review r
+                      SET upvotes   = (SELECT count(*) FROM votes v WHERE v.review_id = r.review_id AND v.vote_type = 1),
+                          downvotes = (SELECT count(*) FROM votes v WHERE v.review_id = r.review_id AND v.vote_type = -1)
+                      WHERE r.review_id = ANY(%s)""", (reviews,))
+
+
+def measure(vote, reviews, users, clients, seconds, seed):
+    results = []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(vote, reviews, users, deadline, seed + i, results))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = [value for result in results for value in result[0]]
+    round_trips = [value for result in results for value in result[1]]
+    errors = {}
+    for result in results:
+        for name, count in result[2].items():
+            errors[name] = errors.get(name, 0) + count
+
+    return {
+        "votes_per_s": round(len(latencies) / seconds, 1),
+        "round_trips": round(sum(round_trips) / len(round_trips), 2) if round_trips else None,
+        "failed": sum(errors.values()),
+        "errors": errors,
+        **(latency_summary(latencies) if latencies else {}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure voting throughput under concurrent clicks")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--users", type=int, default=4, help="users clicking, fewer means more conflicting clicks")
+    parser.add_argument("--reviews", type=int, default=2, help="reviews voted on")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--modes", default="separate,toggle")
+    parser.add_argument("--seed", type=int, default=0)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+
+    connection = database_connection()
+    cursor = connection.cursor()
+    reviews, users = pick(cursor, args.reviews, args.users)
+    if not reviews or not users:
+        sys.exit("needs reviews and users without votes on them")
+
+    results = {"clients": args.clients, "users": len(users), "reviews": len(reviews)}
+    try:
+        for mode in args.modes.split(","):
+            vote = {"separate": separate, "toggle": toggle}[mode]
+            results[mode] = measure(vote, reviews, users, args.clients, args.seconds, args.seed)
+            results[mode]["counters_match"] = counters_match(cursor, reviews)
+            reset(cursor, reviews, users)
+            print(f"{mode}: {results[mode]['votes_per_s']} votes/s, {results[mode]['round_trips']} round trips, "
+                  f"{results[mode]['failed']} failed, counters match: {results[mode]['counters_match']}",
+                  file=sys.stderr)
+    finally:
+        reset(cursor, reviews, users)
+        cursor.close()
+        connection.close()
+
+    finish(args, "vote_toggle", results, higher_is_better=("per_s",))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the tests import the app package from the repository root and must not start background work
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("WARMUP_MODELS", "0")
+os.environ.setdefault("REVIEW_WORKERS", "0")
+os.environ.setdefault("COURSE_INDEX_IN_MEMORY", "0")
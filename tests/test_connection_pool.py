@@ -0,0 +1,125 @@
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+from app.config import db_connection
+from app.config.db_connection import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if not self.connection.healthy:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.healthy = True
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    opened = []
+
+    def fake_connect(**kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(db_connection.psycopg2, "connect", fake_connect)
+    monkeypatch.setattr(db_connection, "register_vector", lambda connection: None)
+    pools = []
+
+    def make(min_size=1, max_size=2, timeout=1, idle_timeout=300, health_check_after=30):
+        pools.append(ConnectionPool(min_size, max_size, timeout, idle_timeout, health_check_after))
+        return pools[-1], opened
+
+    yield make
+    for pool in pools:
+        pool.closeall()
+
+
+def test_checkout_reuses_returned_connections(make_pool):
+    pool, opened = make_pool(min_size=1, max_size=2)
+    assert len(opened) == 1
+
+    first = pool.getconn()
+    assert first is opened[0]
+    second = pool.getconn()
+    assert len(opened) == 2
+    assert pool.stats()["in_use"] == 2
+
+    pool.putconn(first)
+    assert pool.getconn() is first
+    stats = pool.stats()
+    assert stats["size"] == 2
+    assert stats["checkouts"] == 3
+    pool.putconn(first)
+    pool.putconn(second)
+
+
+def test_exhausted_pool_times_out(make_pool):
+    pool, _ = make_pool(min_size=0, max_size=1)
+    pool.getconn()
+
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn(timeout=0.05)
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_waiting_checkout_gets_the_returned_connection(make_pool):
+    pool, _ = make_pool(min_size=0, max_size=1)
+    connection = pool.getconn()
+    threading.Timer(0.05, pool.putconn, args=(connection,)).start()
+
+    assert pool.getconn(timeout=1) is connection
+
+
+def test_unhealthy_idle_connection_is_replaced(make_pool):
+    pool, opened = make_pool(min_size=1, max_size=1, health_check_after=0)
+    opened[0].healthy = False
+
+    connection = pool.getconn()
+    assert connection is opened[1]
+    assert opened[0].closed
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_reaper_closes_idle_connections_above_min_size(make_pool):
+    pool, opened = make_pool(min_size=1, max_size=3, idle_timeout=0)
+    connections = [pool.getconn() for _ in range(3)]
+    for connection in connections:
+        pool.putconn(connection)
+
+    pool.reap_idle()
+    stats = pool.stats()
+    assert stats["size"] == 1
+    assert stats["idle"] == 1
+    assert stats["connections_reaped"] == 2
+    assert sum(1 for connection in opened if connection.closed) == 2
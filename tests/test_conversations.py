@@ -0,0 +1,34 @@
+from app.models.conversations import ConversationMemory
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_fold_truncates_a_summary_over_budget():
+    memory = ConversationMemory(max_tokens=20, count_tokens=count_words, summary_tokens=10,
+                                summarizer=lambda summary, turns: "word " * 50)
+
+    memory.append("s", "one two three four five", "six seven eight nine ten")
+    memory.append("s", "one two three four five", "six seven eight nine ten")
+    memory.append("s", "one two three four five", "six seven eight nine ten")
+
+    summary, turns = memory.history("s")
+    assert summary is not None and summary.endswith("...")
+    assert count_words(summary) <= 10
+    assert memory.counters["summaries"] == 1
+    assert memory.counters["summaries_truncated"] == 1
+    assert memory.stats()["tokens"] <= 20
+
+
+def test_fold_keeps_a_summary_within_budget():
+    memory = ConversationMemory(max_tokens=20, count_tokens=count_words, summary_tokens=10,
+                                summarizer=lambda summary, turns: "asked about courses")
+
+    for _ in range(3):
+        memory.append("s", "one two three four five", "six seven eight nine ten")
+
+    summary, turns = memory.history("s")
+    assert summary == "asked about courses"
+    assert memory.counters["summaries_truncated"] == 0
+    assert len(turns) == 2
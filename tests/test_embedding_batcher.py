@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from app.models.embeddings import EmbeddingBatcher
+
+
+class FakeEmbeddingService:
+    def __init__(self, fail_queries=False):
+        self.fail_queries = fail_queries
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _encode(self, kind, texts):
+        with self._lock:
+            self.calls.append((kind, list(texts)))
+        return [f"{kind}:{text}" for text in texts]
+
+    def encode_queries(self, texts):
+        if self.fail_queries:
+            raise RuntimeError("model failed")
+        return self._encode("query", texts)
+
+    def encode_documents(self, texts):
+        return self._encode("document", texts)
+
+
+def test_window_flushes_concurrent_texts_as_one_batch_per_kind():
+    service = FakeEmbeddingService()
+    batcher = EmbeddingBatcher(service, window_ms=100, max_batch=16)
+
+    futures = [batcher.submit("query", f"q{i}") for i in range(3)]
+    futures += [batcher.submit("document", f"d{i}") for i in range(2)]
+
+    results = [future.result(timeout=2) for future in futures]
+    assert results == ["query:q0", "query:q1", "query:q2", "document:d0", "document:d1"]
+    assert sorted(service.calls) == [("document", ["d0", "d1"]), ("query", ["q0", "q1", "q2"])]
+
+
+def test_full_batch_flushes_before_the_window():
+    service = FakeEmbeddingService()
+    batcher = EmbeddingBatcher(service, window_ms=10_000, max_batch=2)
+
+    futures = [batcher.submit("query", "a"), batcher.submit("query", "b")]
+
+    assert [future.result(timeout=2) for future in futures] == ["query:a", "query:b"]
+
+
+def test_encode_error_is_set_on_every_caller_of_that_kind():
+    service = FakeEmbeddingService(fail_queries=True)
+    batcher = EmbeddingBatcher(service, window_ms=100, max_batch=16)
+
+    queries = [batcher.submit("query", f"q{i}") for i in range(3)]
+    document = batcher.submit("document", "d")
+
+    for future in queries:
+        with pytest.raises(RuntimeError, match="model failed"):
+            future.result(timeout=2)
+    assert document.result(timeout=2) == "document:d"
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from app.models.inference import InferenceExecutor, InferenceQueueFull, InferenceTimeout
+
+
+def blocked_executor(queue_size=1):
+    """
+    Executor with its only worker busy until the returned event is set.
+    """
+    executor = InferenceExecutor(workers=1, queue_size=queue_size, timeout=0)
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+        return "first"
+
+    first = executor.submit(block)
+    assert started.wait(2)
+    return executor, first, release
+
+
+def test_full_queue_rejects_right_away():
+    executor, first, release = blocked_executor(queue_size=1)
+    queued = executor.submit(lambda: "second")
+
+    with pytest.raises(InferenceQueueFull):
+        executor.submit(lambda: "third")
+    assert executor.stats()["rejected"] == 1
+
+    release.set()
+    assert first.result(timeout=2) == "first"
+    assert queued.result(timeout=2) == "second"
+
+
+def test_deadline_raises_timeout_while_generating():
+    executor = InferenceExecutor(workers=1, queue_size=1, timeout=0)
+    release = threading.Event()
+
+    with pytest.raises(InferenceTimeout):
+        executor.run(release.wait, 5, deadline=time.monotonic() + 0.05)
+    assert executor.stats()["timed_out"] == 1
+    release.set()
+
+
+def test_request_expired_in_queue_never_runs():
+    executor, first, release = blocked_executor(queue_size=1)
+    ran = []
+    expired = executor.submit(ran.append, "ran", deadline=time.monotonic() + 0.01)
+    time.sleep(0.05)
+
+    release.set()
+    with pytest.raises(InferenceTimeout):
+        expired.result(timeout=2)
+    assert ran == []
+    assert executor.stats()["expired_in_queue"] == 1
+
+
+def test_timed_out_request_still_queued_is_cancelled():
+    executor, first, release = blocked_executor(queue_size=1)
+    ran = []
+
+    with pytest.raises(InferenceTimeout):
+        executor.run(ran.append, "ran", deadline=time.monotonic() + 0.05)
+
+    release.set()
+    assert first.result(timeout=2) == "first"
+    time.sleep(0.05)
+    assert ran == []